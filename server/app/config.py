@@ -18,6 +18,68 @@ class Settings(BaseSettings):
     # CORS
     CORS_ORIGINS: list[str] = ["*"]
     
+    # WebSocket broker: để trống khi chạy 1 worker, dùng redis://... khi chạy nhiều worker/node
+    BROKER_URL: str = ""
+    BROKER_PRESENCE_TTL: float = 30.0   # Số kết nối của worker không gia hạn trong khoảng này (worker chết) bị bỏ qua
+    
+    # Hàng đợi gửi của mỗi kết nối WebSocket
+    WS_SEND_QUEUE_HIGH_WATERMARK: int = 256   # Bắt đầu bỏ sự kiện không quan trọng (user:typing)
+    WS_SEND_QUEUE_LOW_WATERMARK: int = 64     # Hết bị coi là chậm khi hàng đợi xuống dưới mức này
+    WS_SEND_QUEUE_MAX_SIZE: int = 1024        # Vượt quá sẽ ngắt kết nối ngay
+    WS_SLOW_CONSUMER_TIMEOUT: float = 15.0    # Số giây tối đa được phép nghẽn liên tục
+    
+    # Cache thành viên hội thoại
+    MEMBERSHIP_CACHE_SIZE: int = 10000
+    MEMBERSHIP_CACHE_TTL: float = 300.0
+    
+    # Cache thông tin hiển thị của user (tên, avatar)
+    USER_CACHE_SIZE: int = 50000
+    USER_CACHE_TTL: float = 60.0
+    
+    # Cache xác thực: token đã kiểm tra chữ ký và document user
+    AUTH_TOKEN_CACHE_SIZE: int = 50000
+    AUTH_TOKEN_CACHE_TTL: float = 300.0
+    AUTH_USER_CACHE_SIZE: int = 50000
+    AUTH_USER_CACHE_TTL: float = 30.0
+    
+    # Cache danh sách id bạn bè của user
+    FRIEND_CACHE_SIZE: int = 50000
+    FRIEND_CACHE_TTL: float = 300.0
+    
+    # Trạng thái online
+    PRESENCE_OFFLINE_GRACE: float = 10.0   # Số giây chờ sau khi mất kết nối cuối cùng mới tính là offline
+    PRESENCE_FLUSH_INTERVAL: float = 1.0   # Chu kỳ gộp thay đổi để ghi database và thông báo bạn bè
+    PRESENCE_FANOUT_BATCH: int = 500       # Số bạn bè tối đa trong 1 lượt gửi user:status
+    
+    # Ghi tin nhắn theo lô khi tải cao (0 để tắt, ghi từng tin)
+    MESSAGE_INGEST_BATCH_MS: float = 0.0   # Thời gian tối đa giữ tin nhắn để gộp lô (mili giây)
+    MESSAGE_INGEST_MAX_BATCH: int = 500    # Đủ số tin này thì ghi ngay
+    
+    # Chỉ số theo định dạng Prometheus tại GET /metrics
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""   # Bearer token để đọc /metrics, để trống thì không mở /metrics
+    
+    # Theo dõi truy vấn MongoDB của từng request/sự kiện WebSocket để tìm N+1
+    DB_TRACE_SAMPLE_RATE: float = 0.0      # Tỉ lệ request được theo dõi (0 để tắt, 1 là tất cả)
+    DB_TRACE_REPEAT_THRESHOLD: int = 3     # Số truy vấn cùng dạng trong 1 request để báo N+1
+    
+    # Theo dõi event loop, xem tại GET /diagnostics/loop
+    LOOP_MONITOR_INTERVAL: float = 0.1         # Chu kỳ đo độ trễ (giây), 0 để tắt
+    LOOP_LAG_WINDOW: float = 60.0              # Phân vị độ trễ tính trên khoảng thời gian gần nhất (giây)
+    LOOP_BLOCKED_THRESHOLD_MS: float = 100.0   # Loop bị chặn lâu hơn ngưỡng này thì chụp stack, 0 để tắt
+    LOOP_BLOCKED_HISTORY: int = 50             # Số lần bị chặn gần nhất được giữ lại
+    
+    # Băm/kiểm tra mật khẩu bcrypt chạy ngoài event loop
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 256
+    
+    # Tạo ảnh thu nhỏ trong process pool (0 để tắt)
+    IMAGE_WORKERS: int = 2
+    THUMBNAIL_WAIT_SECONDS: float = 30.0  # Thời gian tối đa chờ ảnh thu nhỏ để gửi bổ sung cho tin nhắn ảnh đã gửi
+    
+    # Chu kỳ dọn file đã upload nhưng không tin nhắn nào dùng (giây, 0 để tắt)
+    BLOB_GC_INTERVAL: float = 3600.0
+    
     class Config:
         env_file = ".env"
 
@@ -1,25 +1,47 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.config import get_settings
+from app.metrics import MongoCommandMetrics
+from app.db_trace import QueryTraceListener
 
 settings = get_settings()
 
 client: AsyncIOMotorClient = None
 db = None
+migration_task: asyncio.Task = None
 
 async def connect_to_mongo():
-    global client, db
-    client = AsyncIOMotorClient(settings.MONGODB_URL, tz_aware=True)
+    global client, db, migration_task
+    listeners = []
+    if settings.METRICS_ENABLED:
+        listeners.append(MongoCommandMetrics())
+    if settings.DB_TRACE_SAMPLE_RATE > 0:
+        listeners.append(QueryTraceListener())
+    client = AsyncIOMotorClient(settings.MONGODB_URL, tz_aware=True, event_listeners=listeners)
     db = client[settings.MONGODB_DB_NAME]
     
     # Tạo indexes
     await db.users.create_index("username", unique=True)
+    await db.users.create_index("search_keys")
     await db.conversations.create_index("members.user_id")
-    await db.messages.create_index([("conversation_id", 1), ("created_at", -1)])
+    # Mỗi nhánh của truy vấn $or theo from_user_id/to_user_id dùng 1 index, kèm sắp xếp lời mời theo thời gian
+    await db.friendships.create_index([("from_user_id", 1), ("status", 1), ("created_at", -1)])
+    await db.friendships.create_index([("to_user_id", 1), ("status", 1), ("created_at", -1)])
+    # _id để phân trang ổn định khi nhiều tin nhắn trùng created_at
+    await db.messages.create_index([("conversation_id", 1), ("created_at", -1), ("_id", -1)])
+    # Chỉ mục tìm kiếm trên nội dung đã bỏ dấu, không dùng stemming theo ngôn ngữ
+    await db.messages.create_index([("search_text", "text")], default_language="none", name="messages_search_text")
+    # Dọn định kỳ blob không còn tham chiếu
+    await db.blobs.create_index([("refcount", 1), ("last_uploaded_at", 1)])
+    
+    # Chuyển đổi dữ liệu cũ
+    from app.migrations import run_background_migrations
+    migration_task = asyncio.create_task(run_background_migrations(db))
     
     # Chạy seed data
     from app.seed import run_seed
-    from app.services import get_password_hash
-    await run_seed(db, get_password_hash)
+    from app.services import get_password_hash_async
+    await run_seed(db, get_password_hash_async)
 
 async def close_mongo_connection():
     global client
@@ -0,0 +1,150 @@
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from pymongo import monitoring
+from app.config import get_settings
+
+# Theo dõi các lệnh MongoDB của từng request HTTP/sự kiện WebSocket được lấy mẫu.
+# Motor chạy lệnh trong thread pool nhưng sao chép contextvars, nên listener của driver
+# biết lệnh thuộc request nào. Truy vấn cùng dạng lặp lại nhiều lần được báo là N+1.
+
+# Lệnh không mang truy vấn, không tính khi tìm N+1 (getMore là đọc tiếp cùng 1 con trỏ)
+IGNORED_REPEATS = {"getMore", "killCursors", "endSessions"}
+MAX_SHAPE_LENGTH = 200
+
+_current: ContextVar[Optional["QueryTrace"]] = ContextVar("db_trace", default=None)
+
+def _shape(value) -> str:
+    """Giữ lại tên trường và toán tử, thay mọi giá trị bằng '?'"""
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{key}:{_shape(v)}" for key, v in value.items()) + "}"
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return "[" + ",".join(_shape(v) for v in value) + "]"
+    return "?"
+
+def query_shape(command_name: str, command) -> str:
+    if command_name in ("find", "count", "distinct"):
+        query = command.get("filter", command.get("query"))
+    elif command_name == "aggregate":
+        query = command.get("pipeline")
+    elif command_name == "findAndModify":
+        query = command.get("query")
+    elif command_name in ("update", "delete"):
+        statements = command.get(command_name + "s") or [{}]
+        query = statements[0].get("q")
+    else:
+        return ""
+    return _shape(query or {})[:MAX_SHAPE_LENGTH]
+
+class QueryTrace:
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        # (command, collection, dạng truy vấn, giây)
+        self.queries: List[Tuple[str, str, str, float]] = []
+        self._pending: Dict[Tuple, Tuple[str, str, str]] = {}
+        self.finished = False
+
+    @property
+    def db_seconds(self) -> float:
+        return sum(query[3] for query in self.queries)
+
+    def repeated(self, threshold: int) -> List[Tuple[Tuple[str, str, str], int]]:
+        """Các dạng truy vấn lặp lại từ threshold lần trở lên, nhiều nhất trước"""
+        counts = Counter(q[:3] for q in self.queries if q[0] not in IGNORED_REPEATS)
+        return [(key, count) for key, count in counts.most_common() if count >= threshold]
+
+    def header(self, threshold: int) -> str:
+        return f"queries={len(self.queries)}; db_ms={self.db_seconds * 1000:.1f}; repeated={len(self.repeated(threshold))}"
+
+    def report(self, threshold: int) -> str:
+        elapsed = (time.perf_counter() - self.started) * 1000
+        lines = [
+            f"Truy vấn MongoDB {self.label}: {len(self.queries)} lệnh, "
+            f"{self.db_seconds * 1000:.1f} ms/{elapsed:.1f} ms"
+        ]
+        for (command, collection, shape), count in self.repeated(threshold):
+            lines.append(f"  N+1? {count} lần {command} {collection} {shape}")
+        return "\n".join(lines)
+
+class QueryTraceListener(monitoring.CommandListener):
+    """Ghi lệnh MongoDB vào trace của request hiện tại (nếu request được lấy mẫu)"""
+
+    def started(self, event):
+        trace = _current.get()
+        if trace is None or trace.finished:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        trace._pending[(event.connection_id, event.request_id)] = (
+            event.command_name, collection, query_shape(event.command_name, event.command)
+        )
+
+    def _complete(self, event):
+        trace = _current.get()
+        if trace is None:
+            return
+        query = trace._pending.pop((event.connection_id, event.request_id), None)
+        if query is not None and not trace.finished:
+            trace.queries.append(query + (event.duration_micros / 1e6,))
+
+    def succeeded(self, event):
+        self._complete(event)
+
+    def failed(self, event):
+        self._complete(event)
+
+def is_enabled() -> bool:
+    return get_settings().DB_TRACE_SAMPLE_RATE > 0
+
+def start_trace(label: str) -> Optional[QueryTrace]:
+    """Bắt đầu theo dõi với xác suất DB_TRACE_SAMPLE_RATE, None nếu không được lấy mẫu"""
+    rate = get_settings().DB_TRACE_SAMPLE_RATE
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return None
+    trace = QueryTrace(label)
+    _current.set(trace)
+    return trace
+
+def finish_trace(trace: Optional[QueryTrace]):
+    """Kết thúc trace và in tóm tắt nếu có truy vấn"""
+    if trace is None or trace.finished:
+        return
+    trace.finished = True
+    if _current.get() is trace:
+        _current.set(None)
+    if trace.queries:
+        print(trace.report(get_settings().DB_TRACE_REPEAT_THRESHOLD))
+
+class DbTraceMiddleware:
+    """ASGI middleware theo dõi truy vấn của request được lấy mẫu, trả tóm tắt qua header X-DB-Trace"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = start_trace(f"{scope['method']} {scope['path']}")
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        threshold = get_settings().DB_TRACE_REPEAT_THRESHOLD
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-trace", trace.header(threshold).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_trace(trace)
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, List, Optional
+from app.config import get_settings
+from app.metrics import LOOP_LAG_SECONDS, LOOP_BLOCKED_TOTAL
+
+# Đo độ trễ của event loop bằng 1 timer định kỳ: timer chạy muộn bao lâu thì loop bị chặn bấy lâu.
+# Một thread riêng canh timer đó, nếu quá hạn hơn ngưỡng thì chụp stack của thread chạy loop
+# ngay lúc đang bị chặn. Cách này dùng được với cả asyncio lẫn uvloop.
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_STACK_FRAMES = 30
+# Middleware đo đạc bọc mọi request, không phải nơi gây chặn
+INSTRUMENTATION_FILES = {os.path.join(SERVER_DIR, "app", name) for name in ("metrics.py", "db_trace.py")}
+
+def _is_app_frame(frame: traceback.FrameSummary) -> bool:
+    return (
+        frame.filename.startswith(SERVER_DIR)
+        and "site-packages" not in frame.filename
+        and frame.filename not in INSTRUMENTATION_FILES
+    )
+
+def _percentile(values: List[float], p: float) -> float:
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+class LoopMonitor:
+    def __init__(self):
+        self._lags: Deque[float] = deque()
+        self._blocked: Deque[dict] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Thời điểm timer lẽ ra phải chạy (monotonic), None khi không chờ
+        self._deadline: Optional[float] = None
+        self._current: Optional[dict] = None
+
+    @property
+    def enabled(self) -> bool:
+        return get_settings().LOOP_MONITOR_INTERVAL > 0
+
+    def start(self):
+        settings = get_settings()
+        if not self.enabled:
+            return
+        self._lags = deque(maxlen=max(1, int(settings.LOOP_LAG_WINDOW / settings.LOOP_MONITOR_INTERVAL)))
+        self._blocked = deque(maxlen=settings.LOOP_BLOCKED_HISTORY)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run(settings.LOOP_MONITOR_INTERVAL))
+        if settings.LOOP_BLOCKED_THRESHOLD_MS > 0:
+            self._watchdog = threading.Thread(
+                target=self._watch,
+                args=(settings.LOOP_BLOCKED_THRESHOLD_MS / 1000,),
+                name="loop-monitor",
+                daemon=True,
+            )
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    async def _run(self, interval: float):
+        while True:
+            self._deadline = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - self._deadline)
+            self._deadline = None
+            self._lags.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            current, self._current = self._current, None
+            if current is not None:
+                current["blocked_ms"] = round(max(current["blocked_ms"], lag * 1000), 1)
+
+    def _watch(self, threshold: float):
+        """Chạy trong thread riêng, chụp stack khi loop quá hạn timer hơn threshold giây"""
+        while not self._stopping.wait(threshold / 2):
+            deadline = self._deadline
+            if deadline is None:
+                continue
+            overdue = time.monotonic() - deadline
+            if overdue < threshold:
+                continue
+            current = self._current
+            if self._deadline != deadline:
+                # Loop vừa chạy lại timer
+                continue
+            if current is not None and current["deadline"] == deadline:
+                current["blocked_ms"] = round(overdue * 1000, 1)
+                continue
+            self._current = self._capture(deadline, overdue)
+            self._blocked.append(self._current)
+            LOOP_BLOCKED_TOTAL.inc()
+            print(f"Event loop bị chặn hơn {self._current['blocked_ms']} ms tại {self._current['handler']}")
+
+    def _capture(self, deadline: float, overdue: float) -> dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.extract_stack(frame)[-MAX_STACK_FRAMES:] if frame else []
+        # Hàm gần nhất thuộc mã nguồn server thường là nơi gây chặn (hoặc đã gọi thư viện gây chặn)
+        handler = next((f for f in reversed(stack) if _is_app_frame(f)), None)
+        task = None
+        try:
+            current_task = asyncio.current_task(self._loop)
+            if current_task is not None:
+                task = current_task.get_name()
+                coro = current_task.get_coro()
+                task += f" ({getattr(coro, '__qualname__', coro)})"
+        except RuntimeError:
+            pass
+        return {
+            "deadline": deadline,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blocked_ms": round(overdue * 1000, 1),
+            "handler": f"{os.path.relpath(handler.filename, SERVER_DIR)}:{handler.lineno} {handler.name}" if handler else None,
+            "task": task,
+            "stack": [f"{f.filename}:{f.lineno} {f.name}" for f in stack],
+        }
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+        lag = {"samples": len(lags)}
+        if lags:
+            lag.update({
+                "p50_ms": round(_percentile(lags, 50) * 1000, 2),
+                "p90_ms": round(_percentile(lags, 90) * 1000, 2),
+                "p99_ms": round(_percentile(lags, 99) * 1000, 2),
+                "max_ms": round(lags[-1] * 1000, 2),
+            })
+        blocked = [{k: v for k, v in entry.items() if k != "deadline"} for entry in reversed(self._blocked)]
+        return {"lag": lag, "blocked": blocked}
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,198 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from pymongo import monitoring
+
+# Các chỉ số được đọc qua GET /metrics theo định dạng text của Prometheus.
+# Không dùng khóa: cập nhật từ thread của driver MongoDB hiếm khi đè nhau và sai lệch không đáng kể.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_registry: List["Metric"] = []
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        _registry.append(self)
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), buckets: Tuple = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [số lần theo từng bucket (không cộng dồn) + bucket +Inf, tổng, số lần]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, labels)} {count}"
+
+class Gauge(Metric):
+    """Giá trị được tính lúc đọc /metrics, callback trả về số hoặc dict {tuple nhãn: số}"""
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Iterable[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, description, labels)
+        self.callback = callback
+
+    def samples(self):
+        if self.callback is None:
+            return
+        value = self.callback()
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, v in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(v)}"
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            lines.append(f"# {metric.name} lỗi: {_escape(e)}")
+    return "\n".join(lines) + "\n"
+
+# Sự kiện WebSocket
+WS_EVENT_SECONDS = Histogram("alo_ws_event_seconds", "Thời gian xử lý sự kiện WebSocket", ["event"])
+WS_EVENT_ERRORS = Counter("alo_ws_event_errors_total", "Số sự kiện WebSocket xử lý lỗi", ["event"])
+WS_CONNECTIONS_OPENED = Counter("alo_ws_connections_opened_total", "Số kết nối WebSocket đã mở")
+WS_EVICTIONS = Counter("alo_ws_slow_consumer_evictions_total", "Số kết nối bị ngắt vì nhận quá chậm")
+WS_FANOUT_SIZE = Histogram("alo_ws_fanout_recipients", "Số user nhận trong mỗi lần broadcast", buckets=SIZE_BUCKETS)
+
+# REST
+HTTP_REQUEST_SECONDS = Histogram("alo_http_request_seconds", "Thời gian xử lý request HTTP", ["method", "route", "status"])
+
+# MongoDB
+MONGO_COMMAND_SECONDS = Histogram("alo_mongo_command_seconds", "Thời gian thực thi lệnh MongoDB", ["command", "collection"])
+MONGO_COMMAND_ERRORS = Counter("alo_mongo_command_errors_total", "Số lệnh MongoDB bị lỗi", ["command", "collection"])
+
+# Băm/kiểm tra mật khẩu
+PASSWORD_WAIT_SECONDS = Histogram("alo_password_hash_wait_seconds", "Thời gian chờ slot trong pool băm mật khẩu")
+PASSWORD_WORK_SECONDS = Histogram("alo_password_hash_seconds", "Thời gian băm/kiểm tra 1 mật khẩu bcrypt")
+
+# Event loop
+LOOP_LAG_SECONDS = Histogram("alo_event_loop_lag_seconds", "Độ trễ của timer đo trên event loop")
+LOOP_BLOCKED_TOTAL = Counter("alo_event_loop_blocked_total", "Số lần event loop bị chặn quá ngưỡng")
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Ghi nhận thời gian của từng lệnh mà driver gửi tới MongoDB"""
+
+    def __init__(self):
+        # (connection_id, request_id) -> tên collection, lấy từ lệnh lúc bắt đầu
+        self._collections: Dict[Tuple, str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # getMore mang id con trỏ, tên collection nằm ở trường riêng
+            target = event.command.get("collection")
+        if isinstance(target, str):
+            self._collections[(event.connection_id, event.request_id)] = target
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, collection)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, event.command_name, collection)
+        MONGO_COMMAND_ERRORS.inc(event.command_name, collection)
+
+class MetricsMiddleware:
+    """ASGI middleware đo thời gian request HTTP, gắn nhãn theo mẫu đường dẫn của route"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[Callable, str] = {}
+
+    def _route_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            else:
+                path = getattr(endpoint, "__name__", "unknown")
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, scope["method"], self._route_label(scope), status
+            )
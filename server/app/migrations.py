@@ -0,0 +1,222 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from app.services.text_search import message_search_text, user_search_keys
+from app.services.conversation_summary import message_preview
+
+MIGRATION_BATCH_SIZE = 1000
+# Mỗi lô hội thoại cần gom trạng thái đọc trên toàn bộ tin nhắn của chúng nên lô nhỏ hơn
+READ_CURSOR_BATCH_SIZE = 100
+SUMMARY_BATCH_SIZE = 100
+# Index đã được thay bằng index mới cùng tiền tố: collection -> tên index cũ
+SUPERSEDED_INDEXES = {
+    "messages": ["conversation_id_1_created_at_-1"],
+}
+INDEX_NOT_FOUND = 27
+
+async def _run_once(db, name: str, migration):
+    """Chạy migration nếu chưa có dấu hoàn tất trong collection migrations"""
+    if await db.migrations.find_one({"_id": name, "completed_at": {"$exists": True}}):
+        return
+    await migration(db)
+    await db.migrations.update_one(
+        {"_id": name},
+        {"$set": {"completed_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def _last_read_messages(db, conversation_ids: List[str]) -> Dict[Tuple[str, str], dict]:
+    """(conversation_id, user_id) -> tin nhắn mới nhất user đã đọc, theo mảng messages.status cũ"""
+    pipeline = [
+        {"$match": {"conversation_id": {"$in": conversation_ids}, "status.status": "read"}},
+        {"$unwind": "$status"},
+        {"$match": {"status.status": "read"}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"conversation_id": "$conversation_id", "user_id": "$status.user_id"},
+            "message_id": {"$first": "$_id"},
+            "created_at": {"$first": "$created_at"},
+        }},
+    ]
+    last_reads = {}
+    async for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+        last_reads[(row["_id"]["conversation_id"], row["_id"]["user_id"])] = row
+    return last_reads
+
+async def migrate_read_cursors(db):
+    """Chuyển trạng thái đã đọc từ mảng messages.status sang mốc đã đọc của từng thành viên"""
+    last_id = None
+    while True:
+        query = {"members": {"$elemMatch": {"last_read_at": {"$exists": False}}}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        conversations = await db.conversations.find(query, {"members.user_id": 1, "members.last_read_at": 1}) \
+            .sort("_id", 1) \
+            .limit(READ_CURSOR_BATCH_SIZE) \
+            .to_list(READ_CURSOR_BATCH_SIZE)
+        if not conversations:
+            return
+        last_id = conversations[-1]["_id"]
+        last_reads = await _last_read_messages(db, [str(c["_id"]) for c in conversations])
+
+        updates = []
+        for conversation in conversations:
+            conversation_id = str(conversation["_id"])
+            for member in conversation["members"]:
+                if "last_read_at" in member:
+                    continue
+                last_read = last_reads.get((conversation_id, member["user_id"]))
+                # Chỉ ghi trường của thành viên chưa có mốc, không ghi đè mốc vừa được dời trong lúc chạy
+                updates.append(UpdateOne(
+                    {"_id": conversation["_id"]},
+                    {"$set": {
+                        "members.$[m].last_read_message_id": str(last_read["message_id"]) if last_read else None,
+                        "members.$[m].last_read_at": last_read["created_at"] if last_read else None,
+                    }},
+                    array_filters=[{"m.user_id": member["user_id"], "m.last_read_at": {"$exists": False}}]
+                ))
+        if updates:
+            await db.conversations.bulk_write(updates, ordered=False)
+
+async def backfill_message_search_text(db):
+    """Tạo trường search_text cho tin nhắn cũ, chạy theo từng lô tăng dần theo _id"""
+    last_id = None
+    while True:
+        query = {"search_text": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        messages = await db.messages.find(query, {"content": 1, "file_name": 1}) \
+            .sort("_id", 1) \
+            .limit(MIGRATION_BATCH_SIZE) \
+            .to_list(MIGRATION_BATCH_SIZE)
+        if not messages:
+            return
+        last_id = messages[-1]["_id"]
+        await db.messages.bulk_write([
+            UpdateOne(
+                {"_id": m["_id"]},
+                {"$set": {"search_text": message_search_text(m.get("content"), m.get("file_name"))}}
+            )
+            for m in messages
+        ], ordered=False)
+
+async def backfill_user_search_keys(db):
+    """Tạo khóa tìm kiếm theo tiền tố cho user cũ, chạy theo từng lô tăng dần theo _id"""
+    last_id = None
+    while True:
+        query = {"search_keys": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        users = await db.users.find(query, {"username": 1, "display_name": 1}) \
+            .sort("_id", 1) \
+            .limit(MIGRATION_BATCH_SIZE) \
+            .to_list(MIGRATION_BATCH_SIZE)
+        if not users:
+            return
+        last_id = users[-1]["_id"]
+        await db.users.bulk_write([
+            UpdateOne(
+                {"_id": u["_id"]},
+                {"$set": {"search_keys": user_search_keys(u["username"], u.get("display_name", ""))}}
+            )
+            for u in users
+        ], ordered=False)
+
+async def _summary_backfill_updates(db, conversation: dict) -> List[UpdateOne]:
+    conversation_id = str(conversation["_id"])
+    latest = await db.messages.find_one(
+        {"conversation_id": conversation_id},
+        {"sender_id": 1, "type": 1, "content": 1, "created_at": 1},
+        sort=[("created_at", -1), ("_id", -1)]
+    )
+
+    counts = {}
+    array_filters = []
+    for i, member in enumerate(conversation["members"]):
+        if "unread_count" in member:
+            continue
+        count = 0
+        if latest:
+            query = {"conversation_id": conversation_id, "sender_id": {"$ne": member["user_id"]}}
+            if member.get("last_read_at"):
+                query["created_at"] = {"$gt": member["last_read_at"]}
+            count = await db.messages.count_documents(query)
+        counts[f"members.$[m{i}].unread_count"] = count
+        # Thành viên đã có số đếm (đếm lại khi đọc) trong lúc chờ thì giữ nguyên
+        array_filters.append({f"m{i}.user_id": member["user_id"], f"m{i}.unread_count": {"$exists": False}})
+
+    updates = []
+    if counts:
+        updates.append(UpdateOne({"_id": conversation["_id"]}, {"$set": counts}, array_filters=array_filters))
+    if latest:
+        # Không ghi đè tin nhắn cuối mới hơn đã được ghi khi gửi
+        updates.append(UpdateOne(
+            {
+                "_id": conversation["_id"],
+                "$or": [
+                    {"last_message_at": None},
+                    {"last_message_at": {"$lte": latest["created_at"]}},
+                ]
+            },
+            {"$set": {
+                "last_message_at": latest["created_at"],
+                "last_message": message_preview(str(latest["_id"]), latest),
+            }}
+        ))
+    else:
+        updates.append(UpdateOne(
+            {"_id": conversation["_id"], "last_message": {"$exists": False}},
+            {"$set": {"last_message": None}}
+        ))
+    return updates
+
+async def backfill_conversation_summaries(db):
+    """Tạo tin nhắn cuối và số tin chưa đọc lưu sẵn cho hội thoại cũ.
+
+    Tin nhắn mới không cộng vào thành viên chưa có số đếm, nên số đếm ở đây là toàn bộ tin chưa
+    đọc. Chỉ ghi từng trường cần thiết, không ghi đè mảng members đang được cập nhật song song.
+    """
+    last_id = None
+    while True:
+        query = {"members": {"$elemMatch": {"unread_count": {"$exists": False}}}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        conversations = await db.conversations.find(query, {"members": 1}) \
+            .sort("_id", 1) \
+            .limit(SUMMARY_BATCH_SIZE) \
+            .to_list(SUMMARY_BATCH_SIZE)
+        if not conversations:
+            return
+        last_id = conversations[-1]["_id"]
+
+        updates = []
+        for conversation in conversations:
+            updates += await _summary_backfill_updates(db, conversation)
+        await db.conversations.bulk_write(updates, ordered=False)
+
+async def drop_superseded_indexes(db):
+    """Xóa index cũ của các bản trước, nếu không mỗi lần ghi phải cập nhật cả index cũ lẫn mới"""
+    for collection, names in SUPERSEDED_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                await db[collection].drop_index(name)
+            except OperationFailure as e:
+                # Worker khác vừa xóa trước
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+
+async def run_background_migrations(db):
+    """Các bước chuyển đổi dữ liệu lớn, chạy sau khi server đã nhận request"""
+    try:
+        await drop_superseded_indexes(db)
+        # Chạy trước vì số tin chưa đọc được tính từ mốc đã đọc
+        await _run_once(db, "read_cursors", migrate_read_cursors)
+        await backfill_user_search_keys(db)
+        await backfill_message_search_text(db)
+        await _run_once(db, "conversation_summaries", backfill_conversation_summaries)
+    except Exception as e:
+        print(f"Lỗi chuyển đổi dữ liệu: {e}")
@@ -2,4 +2,6 @@ from .auth import router as auth_router
 from .conversations import router as conversations_router
 from .users import router as users_router
 from .friends import router as friends_router
-from .files import router as files_router
\ No newline at end of file
+from .files import router as files_router
+from .uploads import router as uploads_router
+from .search import router as search_router
\ No newline at end of file
@@ -3,8 +3,10 @@ from datetime import datetime, timezone
 from bson import ObjectId
 from app.database import get_database
 from app.models import UserCreate, UserLogin, UserResponse
-from app.services import get_password_hash, verify_password, create_access_token, get_current_user
+from app.services import get_password_hash_async, verify_password_async, create_access_token, get_current_user
 from app.services.user_helper import create_self_conversation
+from app.services.user_cache import invalidate_user
+from app.services.text_search import user_search_keys
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -24,7 +26,8 @@ async def register(user_data: UserCreate):
     user_doc = {
         "username": user_data.username,
         "display_name": user_data.display_name,
-        "password_hash": get_password_hash(user_data.password),
+        "search_keys": user_search_keys(user_data.username, user_data.display_name),
+        "password_hash": await get_password_hash_async(user_data.password),
         "avatar_url": None,
         "status": "offline",
         "created_at": datetime.now(timezone.utc),
@@ -55,7 +58,7 @@ async def login(credentials: UserLogin):
     db = get_database()
     
     user = await db.users.find_one({"username": credentials.username})
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+    if not user or not await verify_password_async(credentials.password, user["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Tên đăng nhập hoặc mật khẩu không đúng"
@@ -69,6 +72,7 @@ async def login(credentials: UserLogin):
         {"_id": user["_id"]},
         {"$set": {"last_online": datetime.now(timezone.utc), "status": "online"}}
     )
+    await invalidate_user(user_id)
     
     return {
         "access_token": access_token,
@@ -1,56 +1,113 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from datetime import datetime, timezone
 from bson import ObjectId
-from typing import List
+from bson.errors import InvalidId
+from typing import List, Optional
 from app.database import get_database
 from app.models import ConversationCreate, ConversationResponse
 from app.services import get_current_user
+from app.services.pagination import encode_cursor, decode_cursor, parse_cursor_datetime
+from app.services.user_helper import new_member
+from app.services.blob_store import release_conversation_blobs
+from app.services.membership import (
+    get_conversation_members,
+    cache_conversation_members,
+    invalidate_conversation_members,
+)
+from app.services.friend_graph import are_friends
+from app.services.conversation_summary import format_preview, reset_summary
 
 router = APIRouter(prefix="/conversations", tags=["Conversations"])
 
+MAX_CONVERSATIONS_PAGE = 100
+
+def _conversation_after_cursor(cursor: dict) -> dict:
+    """Điều kiện lấy các hội thoại đứng sau cursor theo thứ tự (is_pinned, last_message_at, _id) giảm dần"""
+    try:
+        is_pinned = bool(cursor["p"])
+        last_message_at = parse_cursor_datetime(cursor.get("t"))
+        conversation_id = ObjectId(cursor["id"])
+    except (KeyError, InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    
+    # Hội thoại chưa có tin nhắn (last_message_at = null) luôn nằm cuối
+    if last_message_at is None:
+        same_pin = {"is_pinned": is_pinned, "last_message_at": None, "_id": {"$lt": conversation_id}}
+    else:
+        same_pin = {
+            "is_pinned": is_pinned,
+            "$or": [
+                {"last_message_at": {"$lt": last_message_at}},
+                {"last_message_at": None},
+                {"last_message_at": last_message_at, "_id": {"$lt": conversation_id}},
+            ]
+        }
+    
+    conditions = [same_pin]
+    if is_pinned:
+        conditions.append({"is_pinned": False})
+    return {"$or": conditions}
+
+def _inbox_pipeline(user_id: str, cursor: Optional[dict], limit: int) -> list:
+    """Pipeline lấy danh sách hội thoại kèm trạng thái ghim, chỉ đọc collection conversations"""
+    pipeline = [
+        {"$match": {"members.user_id": user_id}},
+        {"$addFields": {
+            "is_pinned": {"$in": [user_id, {"$ifNull": ["$pinned_by", []]}]},
+        }},
+    ]
+    if cursor:
+        pipeline.append({"$match": _conversation_after_cursor(cursor)})
+    
+    pipeline += [
+        # Ghim lên đầu, sau đó theo thời gian
+        {"$sort": {"is_pinned": -1, "last_message_at": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        # Số tin chưa đọc được cập nhật sẵn khi gửi/đọc tin nhắn
+        {"$addFields": {
+            "unread_count": {"$ifNull": [
+                {"$let": {
+                    "vars": {"me": {"$arrayElemAt": [
+                        {"$filter": {"input": "$members", "cond": {"$eq": ["$$this.user_id", user_id]}}}, 0
+                    ]}},
+                    "in": "$$me.unread_count",
+                }},
+                0,
+            ]},
+        }},
+    ]
+    return pipeline
+
 @router.get("")
-async def get_conversations(current_user: dict = Depends(get_current_user)):
+async def get_conversations(
+    cursor: Optional[str] = None,
+    limit: int = MAX_CONVERSATIONS_PAGE,
+    current_user: dict = Depends(get_current_user)
+):
     db = get_database()
     user_id = current_user["_id"]
+    limit = max(1, min(limit, MAX_CONVERSATIONS_PAGE))
     
-    cursor = db.conversations.find({"members.user_id": user_id}).sort("last_message_at", -1)
-    conversations = await cursor.to_list(100)
+    after = decode_cursor(cursor) if cursor else None
+    conversations = await db.conversations.aggregate(_inbox_pipeline(user_id, after, limit)).to_list(limit + 1)
+    
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
     
     for conv in conversations:
         conv["_id"] = str(conv["_id"])
-        
-        # Kiểm tra trạng thái ghim
-        pinned_by = conv.get("pinned_by", [])
-        conv["is_pinned"] = user_id in pinned_by
-        
-        # Lấy tin nhắn cuối cùng
-        last_message = await db.messages.find_one(
-            {"conversation_id": str(conv["_id"])},
-            sort=[("created_at", -1)]
-        )
-        if last_message:
-            conv["last_message"] = {
-                "_id": str(last_message["_id"]),
-                "content": last_message["content"],
-                "sender_id": last_message["sender_id"],
-                "type": last_message["type"],
-                "created_at": last_message["created_at"].isoformat() if last_message.get("created_at") else None
-            }
-        else:
-            conv["last_message"] = None
-
-        # Tính số tin nhắn chưa đọc
-        unread_count = await db.messages.count_documents({
-            "conversation_id": str(conv["_id"]),
-            "sender_id": {"$ne": user_id},
-            "status": {"$not": {"$elemMatch": {"user_id": user_id, "status": "read"}}}
-        })
-        conv["unread_count"] = unread_count
+        conv["last_message"] = format_preview(conv.get("last_message"))
     
-    # Sắp xếp: ghim lên đầu, sau đó theo thời gian
-    conversations.sort(key=lambda c: (not c.get("is_pinned", False), c.get("last_message_at") is None))
+    next_cursor = None
+    if has_more:
+        last = conversations[-1]
+        next_cursor = encode_cursor({
+            "p": last["is_pinned"],
+            "t": last.get("last_message_at"),
+            "id": last["_id"],
+        })
     
-    return {"conversations": conversations}
+    return {"conversations": conversations, "next_cursor": next_cursor}
 
 @router.post("")
 async def create_conversation(data: ConversationCreate, current_user: dict = Depends(get_current_user)):
@@ -64,14 +121,7 @@ async def create_conversation(data: ConversationCreate, current_user: dict = Dep
         other_user_id = data.member_ids[0]
         
         # Kiểm tra 2 người phải là bạn bè
-        friendship = await db.friendships.find_one({
-            "status": "accepted",
-            "$or": [
-                {"from_user_id": user_id, "to_user_id": other_user_id},
-                {"from_user_id": other_user_id, "to_user_id": user_id}
-            ]
-        })
-        if not friendship:
+        if not await are_friends(db, user_id, other_user_id):
             raise HTTPException(status_code=403, detail="Bạn cần kết bạn trước khi nhắn tin")
         
         # Kiểm tra cuộc hội thoại riêng đã tồn tại chưa
@@ -83,9 +133,9 @@ async def create_conversation(data: ConversationCreate, current_user: dict = Dep
             existing["_id"] = str(existing["_id"])
             return existing
     
-    members = [{"user_id": user_id, "role": "admin", "joined_at": datetime.now(timezone.utc)}]
+    members = [new_member(user_id, "admin")]
     for member_id in data.member_ids:
-        members.append({"user_id": member_id, "role": "member", "joined_at": datetime.now(timezone.utc)})
+        members.append(new_member(member_id, "member"))
     
     conversation = {
         "type": data.type,
@@ -94,55 +144,133 @@ async def create_conversation(data: ConversationCreate, current_user: dict = Dep
         "created_by": user_id,
         "created_at": datetime.now(timezone.utc),
         "last_message_at": None,
+        "last_message": None,
     }
     
     result = await db.conversations.insert_one(conversation)
     conversation["_id"] = str(result.inserted_id)
+    cache_conversation_members(conversation["_id"], members)
     if "created_at" in conversation and conversation["created_at"]:
         conversation["created_at"] = conversation["created_at"].isoformat()
     
     return conversation
 
 
+MAX_MESSAGES_PAGE = 100
+
+# Chỉ lấy trạng thái "sent" đầu tiên, bỏ phần còn lại của mảng status và trường chỉ mục tìm kiếm
+MESSAGE_PROJECTION = {"status": {"$slice": 1}, "search_text": 0}
+
+def _message_cursor(message: dict) -> str:
+    return encode_cursor({"t": message["created_at"], "id": str(message["_id"])})
+
+def _message_position(cursor: str):
+    data = decode_cursor(cursor)
+    try:
+        return parse_cursor_datetime(data["t"]), ObjectId(data["id"])
+    except (KeyError, InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
+async def _fetch_messages(db, conversation_id: str, created_at, message_id, direction: str, limit: int, inclusive: bool = False):
+    """Lấy tối đa limit tin nhắn trước/sau vị trí (created_at, _id), trả về (danh sách tăng dần theo thời gian, còn nữa hay không)"""
+    query = {"conversation_id": conversation_id}
+    if created_at is not None:
+        op = "$lt" if direction == "before" else "$gt"
+        id_op = op + ("e" if inclusive else "")
+        query["$or"] = [
+            {"created_at": {op: created_at}},
+            {"created_at": created_at, "_id": {id_op: message_id}},
+        ]
+    
+    order = -1 if direction == "before" else 1
+    cursor = db.messages.find(query, MESSAGE_PROJECTION).sort([("created_at", order), ("_id", order)]).limit(limit + 1)
+    messages = await cursor.to_list(limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if direction == "before":
+        messages.reverse()
+    return messages, has_more
+
 @router.get("/{conversation_id}/messages")
-async def get_messages(conversation_id: str, limit: int = 50, current_user: dict = Depends(get_current_user)):
+async def get_messages(
+    conversation_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    around: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     db = get_database()
     user_id = current_user["_id"]
+    limit = max(1, min(limit, MAX_MESSAGES_PAGE))
     
     # Xác minh người dùng là thành viên
-    conversation = await db.conversations.find_one({
-        "_id": ObjectId(conversation_id),
-        "members.user_id": user_id
-    })
-    if not conversation:
+    members = await get_conversation_members(db, conversation_id)
+    if not members or user_id not in members:
         raise HTTPException(status_code=404, detail="Không tìm thấy cuộc hội thoại")
     
-    cursor = db.messages.find({"conversation_id": conversation_id}).sort("created_at", -1).limit(limit)
-    messages = await cursor.to_list(limit)
+    has_more_before = has_more_after = False
+    if around:
+        # Cửa sổ quanh 1 tin nhắn: nửa trước (gồm cả tin nhắn đó) và nửa sau
+        if not ObjectId.is_valid(around):
+            raise HTTPException(status_code=400, detail="ID tin nhắn không hợp lệ")
+        target = await db.messages.find_one(
+            {"_id": ObjectId(around), "conversation_id": conversation_id},
+            {"created_at": 1}
+        )
+        if not target:
+            raise HTTPException(status_code=404, detail="Không tìm thấy tin nhắn")
+        
+        older, has_more_before = await _fetch_messages(
+            db, conversation_id, target["created_at"], target["_id"], "before", limit // 2 + 1, inclusive=True
+        )
+        newer, has_more_after = await _fetch_messages(
+            db, conversation_id, target["created_at"], target["_id"], "after", limit - len(older)
+        )
+        messages = older + newer
+    elif after:
+        created_at, message_id = _message_position(after)
+        messages, has_more_after = await _fetch_messages(db, conversation_id, created_at, message_id, "after", limit)
+        # Còn tin cũ hơn nếu có tin nhắn tại hoặc trước mốc (limit 0 chỉ kiểm tra có tồn tại)
+        _, has_more_before = await _fetch_messages(
+            db, conversation_id, created_at, message_id, "before", 0, inclusive=True
+        )
+    else:
+        created_at, message_id = _message_position(before) if before else (None, None)
+        messages, has_more_before = await _fetch_messages(db, conversation_id, created_at, message_id, "before", limit)
+        has_more_after = before is not None
+    
+    before_cursor = _message_cursor(messages[0]) if messages else before
+    after_cursor = _message_cursor(messages[-1]) if messages else after
     
     for msg in messages:
         msg["_id"] = str(msg["_id"])
         if "created_at" in msg and msg["created_at"]:
             msg["created_at"] = msg["created_at"].isoformat()
     
-    return {"messages": list(reversed(messages))}
+    return {
+        "messages": messages,
+        "has_more_before": has_more_before,
+        "has_more_after": has_more_after,
+        "before_cursor": before_cursor,
+        "after_cursor": after_cursor,
+    }
 
 @router.post("/{conversation_id}/members")
 async def add_member(conversation_id: str, member_id: str, current_user: dict = Depends(get_current_user)):
     db = get_database()
     user_id = current_user["_id"]
     
-    conversation = await db.conversations.find_one({
-        "_id": ObjectId(conversation_id),
-        "members": {"$elemMatch": {"user_id": user_id, "role": "admin"}}
-    })
-    if not conversation:
+    members = await get_conversation_members(db, conversation_id)
+    if not members or members.get(user_id) != "admin":
         raise HTTPException(status_code=403, detail="Chỉ admin mới có thể thêm thành viên")
     
     await db.conversations.update_one(
         {"_id": ObjectId(conversation_id)},
-        {"$push": {"members": {"user_id": member_id, "role": "member", "joined_at": datetime.now(timezone.utc)}}}
+        {"$push": {"members": new_member(member_id, "member")}}
     )
+    await invalidate_conversation_members(conversation_id)
     
     return {"message": "Đã thêm thành viên"}
 
@@ -179,21 +307,16 @@ async def clear_conversation_messages(conversation_id: str, current_user: dict =
     db = get_database()
     user_id = current_user["_id"]
     
-    conversation = await db.conversations.find_one({
-        "_id": ObjectId(conversation_id),
-        "members.user_id": user_id
-    })
-    if not conversation:
+    members = await get_conversation_members(db, conversation_id)
+    if not members or user_id not in members:
         raise HTTPException(status_code=404, detail="Không tìm thấy cuộc hội thoại")
     
     # Xóa tất cả tin nhắn trong cuộc hội thoại
+    await release_conversation_blobs(db, conversation_id)
     result = await db.messages.delete_many({"conversation_id": conversation_id})
     
-    # Reset last_message_at
-    await db.conversations.update_one(
-        {"_id": ObjectId(conversation_id)},
-        {"$set": {"last_message_at": None}}
-    )
+    # Reset tin nhắn cuối và số tin chưa đọc
+    await reset_summary(db, conversation_id)
     
     return {"deleted_count": result.deleted_count, "message": "Đã xóa tất cả tin nhắn"}
 
@@ -216,8 +339,10 @@ async def delete_conversation(conversation_id: str, current_user: dict = Depends
         raise HTTPException(status_code=400, detail="Không thể xóa Cloud của tôi. Hãy dùng chức năng xóa tin nhắn.")
     
     member_ids = [m["user_id"] for m in conversation.get("members", [])]
+    await release_conversation_blobs(db, conversation_id)
     await db.messages.delete_many({"conversation_id": conversation_id})
     await db.conversations.delete_one({"_id": ObjectId(conversation_id)})
+    await invalidate_conversation_members(conversation_id)
     
     # Broadcast tới tất cả thành viên
     await manager.broadcast_to_users({
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
 import os
-import uuid
+from app.database import get_database
 from app.services import get_current_user
+from app.services.blob_store import store_blob
+from app.services.thumbnails import IMAGE_EXTENSIONS, schedule_derivatives, image_payload
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
@@ -15,33 +17,23 @@ async def upload_file(file: UploadFile = File(...), current_user: dict = Depends
     if file_ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="Loại file không được hỗ trợ")
     
-    content = await file.read()
-    
-    # Kiểm tra kích thước
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File quá lớn (tối đa 10MB)")
-    
-    files_dir = os.path.join("uploads", "files")
-    if not os.path.exists(files_dir):
-        os.makedirs(files_dir)
-    
-    # Tạo tên file unique
-    filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(files_dir, filename)
-    
-    # Lưu file
-    with open(file_path, "wb") as f:
-        f.write(content)
-    
-    file_url = f"/uploads/files/{filename}"
+    # Lưu file theo hash nội dung, file trùng chỉ lưu 1 bản
+    db = get_database()
+    blob = await store_blob(db, file, file_ext, MAX_FILE_SIZE)
+    file_size = blob["size"]
+    file_url = blob["url"]
     
     # Xác định loại file
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    file_type = "image" if file_ext in image_extensions else "file"
+    file_type = "image" if file_ext in IMAGE_EXTENSIONS else "file"
+    
+    # Tạo ảnh thu nhỏ ở background, tin nhắn ảnh sẽ mang theo khi gửi
+    if file_type == "image" and not blob["image"]:
+        schedule_derivatives(db, blob["id"], file_ext)
     
     return {
         "file_url": file_url,
         "file_name": file.filename,
-        "file_size": len(content),
-        "file_type": file_type
+        "file_size": file_size,
+        "file_type": file_type,
+        "image": image_payload(blob["image"]),
     }
\ No newline at end of file
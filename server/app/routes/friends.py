@@ -1,63 +1,102 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from datetime import datetime, timezone
 from bson import ObjectId
-from typing import List
+from bson.errors import InvalidId
+from typing import Dict, List, Optional
 from app.database import get_database
 from app.models.friendship import FriendRequestCreate, FriendRequestResponse, FriendResponse
 from app.services import get_current_user
+from app.services.user_cache import get_user_profile, get_user_profiles
+from app.services.pagination import encode_cursor, decode_cursor, parse_cursor_datetime
+from app.services.friend_graph import are_friends, invalidate_friends
 from app.websocket import manager
 
 router = APIRouter(prefix="/friends", tags=["Friends"])
 
+MAX_FRIENDS_PAGE = 100
+MAX_REQUESTS_PAGE = 50
+
+def _format_user_info(user: dict) -> dict:
+    info = {
+        "id": user["_id"],
+        "username": user["username"],
+        "display_name": user.get("display_name", user["username"]),
+        "avatar_url": user.get("avatar_url"),
+        "status": user.get("status", "offline"),
+    }
+    if user.get("last_online"):
+        last = user["last_online"]
+        info["last_online"] = last.replace(tzinfo=timezone.utc).isoformat() if isinstance(last, datetime) else last
+    return info
+
 async def get_user_info(db, user_id: str):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    user = await get_user_profile(db, user_id)
     if user:
-        info = {
-            "id": str(user["_id"]),
-            "username": user["username"],
-            "display_name": user.get("display_name", user["username"]),
-            "avatar_url": user.get("avatar_url"),
-            "status": user.get("status", "offline"),
-        }
-        if user.get("last_online"):
-            last = user["last_online"]
-            info["last_online"] = last.replace(tzinfo=timezone.utc).isoformat() if isinstance(last, datetime) else last
-        return info
+        return _format_user_info(user)
     return None
 
-async def are_friends(db, user1_id: str, user2_id: str) -> bool:
-    friendship = await db.friendships.find_one({
-        "status": "accepted",
-        "$or": [
-            {"from_user_id": user1_id, "to_user_id": user2_id},
-            {"from_user_id": user2_id, "to_user_id": user1_id}
-        ]
-    })
-    return friendship is not None
+async def get_user_infos(db, user_ids: List[str]) -> Dict[str, dict]:
+    """Lấy thông tin của nhiều user bằng 1 truy vấn $in (bỏ qua user đã có trong cache)"""
+    profiles = await get_user_profiles(db, user_ids)
+    return {user_id: _format_user_info(user) for user_id, user in profiles.items()}
+
+def _friendship_after_cursor(cursor: dict) -> dict:
+    """Điều kiện lấy các quan hệ bạn bè đứng sau cursor theo thứ tự (created_at, _id) giảm dần"""
+    try:
+        created_at = parse_cursor_datetime(cursor["t"])
+        friendship_id = ObjectId(cursor["id"])
+    except (KeyError, InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": friendship_id}},
+    ]}
 
 @router.get("")
-async def get_friends(current_user: dict = Depends(get_current_user)):
+async def get_friends(
+    cursor: Optional[str] = None,
+    limit: int = MAX_FRIENDS_PAGE,
+    current_user: dict = Depends(get_current_user)
+):
     db = get_database()
     user_id = current_user["_id"]
+    limit = max(1, min(limit, MAX_FRIENDS_PAGE))
     
-    # Tìm tất cả friendships đã accepted
-    cursor = db.friendships.find({
+    # Tìm friendships đã accepted, mới nhất trước
+    query = {
         "status": "accepted",
         "$or": [
             {"from_user_id": user_id},
             {"to_user_id": user_id}
         ]
-    })
-    friendships = await cursor.to_list(100)
-    
-    friends = []
-    for fs in friendships:
-        friend_id = fs["to_user_id"] if fs["from_user_id"] == user_id else fs["from_user_id"]
-        friend_info = await get_user_info(db, friend_id)
-        if friend_info:
-            friends.append(friend_info)
-    
-    return {"friends": friends}
+    }
+    if cursor:
+        query = {"$and": [query, _friendship_after_cursor(decode_cursor(cursor))]}
+    
+    friendships = await db.friendships.find(
+        query,
+        {"from_user_id": 1, "to_user_id": 1, "created_at": 1}
+    ).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    
+    has_more = len(friendships) > limit
+    friendships = friendships[:limit]
+    
+    friend_ids = [
+        fs["to_user_id"] if fs["from_user_id"] == user_id else fs["from_user_id"]
+        for fs in friendships
+    ]
+    infos = await get_user_infos(db, friend_ids)
+    friends = [infos[fid] for fid in friend_ids if fid in infos]
+    
+    next_cursor = None
+    if has_more:
+        last = friendships[-1]
+        next_cursor = encode_cursor({"t": last.get("created_at"), "id": last["_id"]})
+    
+    return {"friends": friends, "next_cursor": next_cursor}
+
+def _format_created_at(req: dict) -> Optional[str]:
+    return req["created_at"].isoformat() if req.get("created_at") else None
 
 @router.get("/requests")
 async def get_friend_requests(current_user: dict = Depends(get_current_user)):
@@ -69,11 +108,13 @@ async def get_friend_requests(current_user: dict = Depends(get_current_user)):
         "to_user_id": user_id,
         "status": "pending"
     }).sort("created_at", -1)
-    requests = await cursor.to_list(50)
+    requests = await cursor.to_list(MAX_REQUESTS_PAGE)
+    
+    senders = await get_user_infos(db, [req["from_user_id"] for req in requests])
     
     result = []
     for req in requests:
-        from_user = await get_user_info(db, req["from_user_id"])
+        from_user = senders.get(req["from_user_id"])
         if from_user:
             result.append({
                 "id": str(req["_id"]),
@@ -84,7 +125,7 @@ async def get_friend_requests(current_user: dict = Depends(get_current_user)):
                 "to_user_name": current_user.get("display_name", ""),
                 "to_user_avatar": current_user.get("avatar_url"),
                 "status": req["status"],
-                "created_at": req["created_at"].isoformat() if req.get("created_at") else None
+                "created_at": _format_created_at(req)
             })
     
     return {"requests": result}
@@ -98,11 +139,13 @@ async def get_sent_requests(current_user: dict = Depends(get_current_user)):
         "from_user_id": user_id,
         "status": "pending"
     }).sort("created_at", -1)
-    requests = await cursor.to_list(50)
+    requests = await cursor.to_list(MAX_REQUESTS_PAGE)
+    
+    recipients = await get_user_infos(db, [req["to_user_id"] for req in requests])
     
     result = []
     for req in requests:
-        to_user = await get_user_info(db, req["to_user_id"])
+        to_user = recipients.get(req["to_user_id"])
         if to_user:
             result.append({
                 "id": str(req["_id"]),
@@ -110,7 +153,7 @@ async def get_sent_requests(current_user: dict = Depends(get_current_user)):
                 "to_user_name": to_user["display_name"],
                 "to_user_avatar": to_user.get("avatar_url"),
                 "status": req["status"],
-                "created_at": req["created_at"].isoformat() if req.get("created_at") else None
+                "created_at": _format_created_at(req)
             })
     
     return {"sent_requests": result}
@@ -198,6 +241,7 @@ async def accept_friend_request(request_id: str, current_user: dict = Depends(ge
         {"_id": ObjectId(request_id)},
         {"$set": {"status": "accepted", "accepted_at": datetime.now(timezone.utc)}}
     )
+    await invalidate_friends(user_id, request["from_user_id"])
     
     # Gửi WebSocket notification đến người đã gửi lời mời
     from_user_id = request["from_user_id"]
@@ -259,6 +303,7 @@ async def unfriend(friend_id: str, current_user: dict = Depends(get_current_user
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Không tìm thấy quan hệ bạn bè")
+    await invalidate_friends(user_id, friend_id)
     
     return {"message": "Đã hủy kết bạn"}
 
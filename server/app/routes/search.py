@@ -0,0 +1,73 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import Optional
+from app.database import get_database
+from app.services import get_current_user
+from app.services.pagination import encode_cursor, decode_cursor
+from app.services.text_search import tokenize
+from app.services.membership import get_conversation_members
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+MAX_SEARCH_PAGE = 50
+
+@router.get("/messages")
+async def search_messages(
+    q: str,
+    conversation_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """Tìm tin nhắn trong các hội thoại của người dùng, xếp theo độ liên quan"""
+    db = get_database()
+    user_id = current_user["_id"]
+    limit = max(1, min(limit, MAX_SEARCH_PAGE))
+    
+    terms = tokenize(q)
+    if not terms:
+        return {"messages": [], "next_cursor": None}
+    
+    # Chỉ tìm trong các hội thoại mà người dùng là thành viên
+    if conversation_id:
+        members = await get_conversation_members(db, conversation_id)
+        if not members or user_id not in members:
+            raise HTTPException(status_code=404, detail="Không tìm thấy cuộc hội thoại")
+        scope = conversation_id
+    else:
+        conversations = await db.conversations.find({"members.user_id": user_id}, {"_id": 1}).to_list(None)
+        scope = {"$in": [str(c["_id"]) for c in conversations]}
+    
+    offset = 0
+    if cursor:
+        offset = decode_cursor(cursor).get("o", 0)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    
+    query = {"$text": {"$search": " ".join(terms)}, "conversation_id": scope}
+    projection = {
+        "score": {"$meta": "textScore"},
+        "conversation_id": 1,
+        "sender_id": 1,
+        "content": 1,
+        "type": 1,
+        "file_url": 1,
+        "file_name": 1,
+        "created_at": 1,
+    }
+    results = await db.messages.find(query, projection) \
+        .sort([("score", {"$meta": "textScore"}), ("created_at", -1)]) \
+        .skip(offset) \
+        .limit(limit + 1) \
+        .to_list(limit + 1)
+    
+    has_more = len(results) > limit
+    results = results[:limit]
+    for msg in results:
+        msg["_id"] = str(msg["_id"])
+        if msg.get("created_at"):
+            msg["created_at"] = msg["created_at"].isoformat()
+    
+    return {
+        "messages": results,
+        "next_cursor": encode_cursor({"o": offset + limit}) if has_more else None,
+    }
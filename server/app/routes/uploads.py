@@ -0,0 +1,96 @@
+import os
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app.services.blob_store import BLOB_NAME_RE, DERIVATIVE_NAME_RE
+from app.services.storage import UPLOAD_CHUNK_SIZE
+
+router = APIRouter(tags=["Uploads"])
+
+UPLOADS_DIR = os.path.realpath("uploads")
+
+# File lưu theo nội dung không bao giờ thay đổi nên được cache vĩnh viễn
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+
+def _resolve(path: str) -> str:
+    full_path = os.path.realpath(os.path.join(UPLOADS_DIR, path))
+    if not full_path.startswith(UPLOADS_DIR + os.sep) or not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Không tìm thấy file")
+    return full_path
+
+def _parse_range(header: str, size: int):
+    """Đọc header Range dạng bytes=start-end, chỉ hỗ trợ 1 khoảng"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-N: N byte cuối
+            start = max(0, size - int(end_text))
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Khoảng dữ liệu không hợp lệ",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+async def _iter_file(path: str, start: int, length: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+@router.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+async def serve_upload(path: str, request: Request):
+    full_path = _resolve(path)
+    stat_result = os.stat(full_path)
+    name = os.path.basename(full_path)
+    
+    match = BLOB_NAME_RE.match(name) or DERIVATIVE_NAME_RE.match(name)
+    if match:
+        etag = f'"{match.group(1)}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+        cache_control = DEFAULT_CACHE_CONTROL
+    
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = _parse_range(range_header, stat_result.st_size)
+    
+    if byte_range is None:
+        return FileResponse(full_path, headers=headers, stat_result=stat_result, method=request.method)
+    
+    start, end = byte_range
+    length = end - start + 1
+    media_type = FileResponse(full_path, stat_result=stat_result).media_type
+    headers.update({
+        "Content-Range": f"bytes {start}-{end}/{stat_result.st_size}",
+        "Content-Length": str(length),
+    })
+    if request.method == "HEAD":
+        return Response(status_code=206, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(full_path, start, length), status_code=206, headers=headers, media_type=media_type)
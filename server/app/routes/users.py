@@ -1,38 +1,67 @@
 from fastapi import APIRouter, Depends, UploadFile, File
 import os
+import re
 import uuid
 from bson import ObjectId
 from app.database import get_database
 from app.services import get_current_user
+from app.services.user_cache import invalidate_user
+from app.services.storage import stream_to_temp, remove_quietly
+from app.services.thumbnails import render_avatar
+from app.services.text_search import normalize_text
+from app.services.friend_graph import get_friend_ids
 from app.config import get_settings
 from app.websocket import manager
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+MAX_AVATAR_SIZE = 5 * 1024 * 1024  # 5MB
+
+MAX_SEARCH_RESULTS = 20
+
+def _format_search_result(user: dict, is_friend: bool) -> dict:
+    return {
+        "id": str(user["_id"]),
+        "username": user["username"],
+        "display_name": user["display_name"],
+        "avatar_url": user.get("avatar_url"),
+        "status": user.get("status", "offline"),
+        "is_friend": is_friend,
+    }
+
 @router.get("/search")
 async def search_users(q: str, current_user: dict = Depends(get_current_user)):
     db = get_database()
+    user_id = current_user["_id"]
     
-    cursor = db.users.find({
-        "$or": [
-            {"username": {"$regex": q, "$options": "i"}},
-            {"display_name": {"$regex": q, "$options": "i"}}
-        ],
-        "_id": {"$ne": ObjectId(current_user["_id"])}
-    }).limit(20)
+    prefix = normalize_text(q)
+    if not prefix:
+        return {"users": []}
     
-    users = await cursor.to_list(20)
+    # Tìm theo tiền tố trên index search_keys (đã bỏ dấu, viết thường)
+    key_filter = {"$regex": "^" + re.escape(prefix)}
+    projection = {"username": 1, "display_name": 1, "avatar_url": 1, "status": 1}
+    
+    # Bạn bè được xếp lên đầu
+    friend_ids = [ObjectId(fid) for fid in await get_friend_ids(db, user_id)]
+    
+    friends = []
+    if friend_ids:
+        friends = await db.users.find(
+            {"_id": {"$in": friend_ids}, "search_keys": key_filter},
+            projection
+        ).limit(MAX_SEARCH_RESULTS).to_list(MAX_SEARCH_RESULTS)
     
-    result = []
-    for user in users:
-        result.append({
-            "id": str(user["_id"]),
-            "username": user["username"],
-            "display_name": user["display_name"],
-            "avatar_url": user.get("avatar_url"),
-            "status": user.get("status", "offline"),
-        })
+    others = []
+    remaining = MAX_SEARCH_RESULTS - len(friends)
+    if remaining > 0:
+        others = await db.users.find(
+            {"_id": {"$nin": friend_ids + [ObjectId(user_id)]}, "search_keys": key_filter},
+            projection
+        ).limit(remaining).to_list(remaining)
     
+    result = [_format_search_result(u, True) for u in friends]
+    result += [_format_search_result(u, False) for u in others]
     return {"users": result}
 
 @router.post("/avatar")
@@ -42,16 +71,18 @@ async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depen
     user_id = str(current_user["_id"])
     
     avatar_dir = os.path.join("uploads", "avatars")
-    if not os.path.exists(avatar_dir):
-        os.makedirs(avatar_dir)
 
     file_ext = os.path.splitext(file.filename)[1]
-    filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = os.path.join(avatar_dir, filename)
     
-    # Lưu file
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    # Lưu file, thu nhỏ về kích thước avatar nếu đọc được ảnh
+    tmp_path, _, _ = await stream_to_temp(file, avatar_dir, MAX_AVATAR_SIZE)
+    try:
+        filename = f"{uuid.uuid4()}.webp"
+        if not await render_avatar(tmp_path, os.path.join(avatar_dir, filename)):
+            filename = f"{uuid.uuid4()}{file_ext}"
+            os.replace(tmp_path, os.path.join(avatar_dir, filename))
+    finally:
+        remove_quietly(tmp_path)
     avatar_url = f"/uploads/avatars/{filename}"
     
     # Cập nhật database
@@ -59,19 +90,9 @@ async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depen
         {"_id": ObjectId(user_id)},
         {"$set": {"avatar_url": avatar_url}}
     )
+    await invalidate_user(user_id)
 
-    friendships_cursor = db.friendships.find({
-        "status": "accepted",
-        "$or": [
-            {"from_user_id": user_id},
-            {"to_user_id": user_id}
-        ]
-    })
-    friendships = await friendships_cursor.to_list(1000)
-    friend_ids = []
-    for fs in friendships:
-        fid = fs["to_user_id"] if fs["from_user_id"] == user_id else fs["from_user_id"]
-        friend_ids.append(fid)
+    friend_ids = list(await get_friend_ids(db, user_id))
 
     if friend_ids:
         await manager.broadcast_to_users({
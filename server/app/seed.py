@@ -2,6 +2,7 @@ import os
 import json
 from datetime import datetime, timezone
 from app.services.user_helper import create_self_conversation
+from app.services.text_search import user_search_keys
 
 async def seed_users(db, get_password_hash):
     json_path = os.path.join(os.getcwd(), "default_users.json")
@@ -29,7 +30,8 @@ async def seed_users(db, get_password_hash):
         user_doc = {
             "username": user_data["username"],
             "display_name": user_data["display_name"],
-            "password_hash": get_password_hash(user_data["password"]),
+            "search_keys": user_search_keys(user_data["username"], user_data["display_name"]),
+            "password_hash": await get_password_hash(user_data["password"]),
             "avatar_url": None,
             "status": "offline",
             "is_admin": user_data.get("is_admin", False),
@@ -1,7 +1,11 @@
 from .auth_service import (
     verify_password,
     get_password_hash,
+    verify_password_async,
+    get_password_hash_async,
     create_access_token,
     decode_access_token,
     get_current_user,
+    get_current_admin,
+    get_password_stats,
 )
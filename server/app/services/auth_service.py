@@ -1,4 +1,8 @@
+import asyncio
 import bcrypt
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,10 +10,20 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.config import get_settings
 from app.database import get_database
+from app.metrics import PASSWORD_WAIT_SECONDS, PASSWORD_WORK_SECONDS
+from .cache import TTLCache
+from .user_cache import auth_user_cache
 
 settings = get_settings()
 security = HTTPBearer()
 
+# Payload của token đã xác minh chữ ký, key là SHA-256 của token
+token_cache = TTLCache(
+    "verified_tokens",
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.AUTH_TOKEN_CACHE_TTL,
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     password_byte = plain_password.encode('utf-8')
     hashed_password_byte = hashed_password.encode('utf-8')
@@ -20,6 +34,55 @@ def get_password_hash(password: str) -> str:
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(pwd_bytes, salt).decode('utf-8')
 
+# bcrypt nhả GIL khi tính toán nên chạy trong thread pool riêng là đủ để không chặn event loop
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash",
+)
+_password_slots: Optional[asyncio.Semaphore] = None
+_password_stats = {"queued": 0, "in_flight": 0, "completed": 0, "rejected": 0}
+
+async def _run_password_work(func, *args):
+    global _password_slots
+    if _password_slots is None:
+        _password_slots = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+    
+    # Từ chối sớm khi hàng đợi quá dài thay vì để request treo
+    if _password_stats["queued"] >= settings.PASSWORD_HASH_MAX_QUEUE:
+        _password_stats["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Máy chủ đang bận, vui lòng thử lại sau",
+        )
+    
+    _password_stats["queued"] += 1
+    started = time.perf_counter()
+    try:
+        await _password_slots.acquire()
+    finally:
+        _password_stats["queued"] -= 1
+    PASSWORD_WAIT_SECONDS.observe(time.perf_counter() - started)
+    
+    _password_stats["in_flight"] += 1
+    started = time.perf_counter()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_password_executor, func, *args)
+    finally:
+        PASSWORD_WORK_SECONDS.observe(time.perf_counter() - started)
+        _password_stats["in_flight"] -= 1
+        _password_stats["completed"] += 1
+        _password_slots.release()
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_work(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run_password_work(get_password_hash, password)
+
+def get_password_stats() -> dict:
+    return {"workers": settings.PASSWORD_HASH_WORKERS, **_password_stats}
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -31,11 +94,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 def decode_access_token(token: str) -> Optional[dict]:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+    
+    started = time.perf_counter()
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        return payload
     except JWTError:
         return None
+    token_cache.record_load(time.perf_counter() - started)
+    
+    # Không giữ token trong cache quá thời điểm hết hạn
+    exp = payload.get("exp")
+    ttl = token_cache.ttl if exp is None else min(token_cache.ttl, exp - time.time())
+    if ttl > 0:
+        token_cache.set(key, payload, ttl=ttl)
+    return payload
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
@@ -55,15 +131,31 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Dữ liệu token không hợp lệ",
         )
     
-    db = get_database()
-    from bson import ObjectId
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    
+    user = auth_user_cache.get(user_id)
     if user is None:
+        db = get_database()
+        from bson import ObjectId
+        started = time.perf_counter()
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Không tìm thấy người dùng",
+            )
+        
+        user["_id"] = str(user["_id"])
+        auth_user_cache.record_load(time.perf_counter() - started)
+        auth_user_cache.set(user_id, user)
+    
+    # Trả bản sao để route không sửa vào dữ liệu trong cache
+    return dict(user)
+
+async def get_current_admin(current_user: dict = Depends(get_current_user)):
+    """Chỉ cho phép tài khoản quản trị (is_admin) truy cập"""
+    if not current_user.get("is_admin"):
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Không tìm thấy người dùng",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Chỉ quản trị viên được truy cập",
         )
-    
-    user["_id"] = str(user["_id"])
-    return user
\ No newline at end of file
+    return current_user
@@ -0,0 +1,154 @@
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from fastapi import UploadFile
+from pymongo import ReturnDocument, UpdateOne
+from .storage import stream_to_temp, remove_quietly
+
+BLOB_DIR = os.path.join("uploads", "files")
+BLOB_URL_PREFIX = "/uploads/files/"
+
+# Tên file lưu theo nội dung: <sha256><đuôi file>
+BLOB_NAME_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]+)?$")
+# Ảnh thu nhỏ sinh ra từ blob: <sha256>_w<chiều rộng>.webp
+DERIVATIVE_NAME_RE = re.compile(r"^([0-9a-f]{64}_w\d+)\.webp$")
+
+# Chiều rộng các ảnh thu nhỏ được tạo cho blob ảnh
+THUMBNAIL_WIDTHS = (240, 480, 960)
+
+# Không xóa blob vừa được upload lại, tránh xóa nhầm file sắp được gửi
+GC_GRACE_PERIOD = timedelta(hours=1)
+GC_BATCH_SIZE = 500
+
+def derivative_name(blob_id: str, width: int) -> str:
+    return f"{blob_id[:64]}_w{width}.webp"
+
+def blob_id_from_url(url: Optional[str]) -> Optional[str]:
+    """Lấy tên blob từ file_url, None nếu không phải file lưu theo nội dung"""
+    if not url or not url.startswith(BLOB_URL_PREFIX):
+        return None
+    name = url[len(BLOB_URL_PREFIX):]
+    return name if BLOB_NAME_RE.match(name) else None
+
+async def store_blob(db, file: UploadFile, file_ext: str, max_size: int) -> dict:
+    """Lưu file theo hash nội dung, file trùng nội dung chỉ được lưu 1 lần"""
+    tmp_path, size, digest = await stream_to_temp(file, BLOB_DIR, max_size)
+    blob_id = f"{digest}{file_ext}"
+    path = os.path.join(BLOB_DIR, blob_id)
+    
+    # Ghi nhận lượt upload trước để bộ dọn rác không xóa file trong lúc này
+    now = datetime.now(timezone.utc)
+    blob = await db.blobs.find_one_and_update(
+        {"_id": blob_id},
+        {
+            "$setOnInsert": {"sha256": digest, "size": size, "refcount": 0, "created_at": now},
+            "$set": {"last_uploaded_at": now},
+        },
+        projection={"image": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    
+    # Luôn thay file (cùng nội dung): file cũ có thể đang bị bộ dọn rác xóa nếu document vừa được tạo lại
+    os.replace(tmp_path, path)
+    
+    return {
+        "id": blob_id,
+        "url": f"{BLOB_URL_PREFIX}{blob_id}",
+        "size": size,
+        "sha256": digest,
+        "image": blob.get("image"),
+    }
+
+async def retain_blob(db, file_url: Optional[str]) -> Optional[dict]:
+    """Tăng số tin nhắn tham chiếu tới blob, trả về document blob (kèm thông tin ảnh nếu có)"""
+    blob_id = blob_id_from_url(file_url)
+    if not blob_id:
+        return None
+    return await db.blobs.find_one_and_update(
+        {"_id": blob_id},
+        {"$inc": {"refcount": 1}},
+        projection={"image": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def release_blob(db, file_url: Optional[str]):
+    """Hoàn lại retain_blob khi tin nhắn không được ghi"""
+    blob_id = blob_id_from_url(file_url)
+    if not blob_id:
+        return
+    await db.blobs.update_one({"_id": blob_id}, {"$inc": {"refcount": -1}})
+    await collect_garbage(db, [blob_id])
+
+async def release_conversation_blobs(db, conversation_id: str):
+    """Giảm tham chiếu các blob trong hội thoại sắp bị xóa tin nhắn và dọn các blob không còn dùng"""
+    cursor = db.messages.aggregate([
+        {"$match": {"conversation_id": conversation_id, "file_url": {"$type": "string"}}},
+        {"$group": {"_id": "$file_url", "count": {"$sum": 1}}},
+    ])
+    counts: Dict[str, int] = {}
+    async for row in cursor:
+        blob_id = blob_id_from_url(row["_id"])
+        if blob_id:
+            counts[blob_id] = counts.get(blob_id, 0) + row["count"]
+    
+    if not counts:
+        return
+    
+    await db.blobs.bulk_write(
+        [UpdateOne({"_id": blob_id}, {"$inc": {"refcount": -count}}) for blob_id, count in counts.items()],
+        ordered=False
+    )
+    await collect_garbage(db, list(counts))
+
+def _remove_blob_files(blob_ids: List[str]):
+    for blob_id in blob_ids:
+        remove_quietly(os.path.join(BLOB_DIR, blob_id))
+        for width in THUMBNAIL_WIDTHS:
+            remove_quietly(os.path.join(BLOB_DIR, derivative_name(blob_id, width)))
+
+async def collect_garbage(db, blob_ids: list):
+    cutoff = datetime.now(timezone.utc) - GC_GRACE_PERIOD
+    removed = []
+    for blob_id in blob_ids:
+        # Xóa document trước, chỉ xóa file khi xóa document thành công
+        result = await db.blobs.delete_one({
+            "_id": blob_id,
+            "refcount": {"$lte": 0},
+            "last_uploaded_at": {"$lt": cutoff},
+        })
+        if result.deleted_count:
+            removed.append(blob_id)
+    if not removed:
+        return
+    # Blob được upload lại sau khi xóa document: file thuộc về document mới, không xóa
+    reuploaded = {b["_id"] for b in await db.blobs.find({"_id": {"$in": removed}}, {"_id": 1}).to_list(None)}
+    await asyncio.to_thread(_remove_blob_files, [blob_id for blob_id in removed if blob_id not in reuploaded])
+
+async def sweep_unreferenced_blobs(db):
+    """Dọn các blob đã upload nhưng không tin nhắn nào dùng (hoặc không còn dùng) quá thời gian chờ"""
+    cutoff = datetime.now(timezone.utc) - GC_GRACE_PERIOD
+    last_id = None
+    while True:
+        query = {"refcount": {"$lte": 0}, "last_uploaded_at": {"$lt": cutoff}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        blobs = await db.blobs.find(query, {"_id": 1}) \
+            .sort("_id", 1) \
+            .limit(GC_BATCH_SIZE) \
+            .to_list(GC_BATCH_SIZE)
+        if not blobs:
+            return
+        last_id = blobs[-1]["_id"]
+        await collect_garbage(db, [b["_id"] for b in blobs])
+
+async def run_blob_gc(db, interval: float):
+    """Chạy sweep_unreferenced_blobs định kỳ mỗi interval giây"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_unreferenced_blobs(db)
+        except Exception as e:
+            print(f"Lỗi dọn file không dùng: {e}")
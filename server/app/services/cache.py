@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from app.websocket import manager
+
+_caches: Dict[str, "TTLCache"] = {}
+
+class TTLCache:
+    """Cache trong process, loại bỏ theo LRU và thời gian sống, có đếm hit/miss"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Tổng thời gian tải dữ liệu khi miss, dùng để ước tính thời gian tiết kiệm được
+        self.load_seconds = 0.0
+        self.loads = 0
+        _caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def record_load(self, seconds: float):
+        """Ghi nhận thời gian tải dữ liệu gốc cho 1 lần miss"""
+        self.load_seconds += seconds
+        self.loads += 1
+
+    def discard(self, key: Hashable):
+        """Xóa key trong cache của worker hiện tại"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def invalidate(self, *keys: Hashable):
+        """Xóa key ở worker hiện tại và thông báo cho các worker khác"""
+        for key in keys:
+            self.discard(key)
+        await manager.publish_event("cache:invalidate", {"cache": self.name, "keys": list(keys)})
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        avg_load = self.load_seconds / self.loads if self.loads else 0.0
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "avg_load_seconds": avg_load,
+            "saved_seconds": self.hits * avg_load,
+        }
+
+def get_caches() -> Dict[str, TTLCache]:
+    return _caches
+
+async def _on_remote_invalidate(data: dict):
+    cache = _caches.get(data.get("cache"))
+    if cache:
+        for key in data.get("keys", []):
+            cache.discard(key)
+
+manager.add_event_handler("cache:invalidate", _on_remote_invalidate)
@@ -0,0 +1,71 @@
+from collections import Counter
+from typing import List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+
+# Số ký tự tối đa của nội dung xem trước tin nhắn cuối
+PREVIEW_CONTENT_LENGTH = 200
+
+def message_preview(message_id: str, message: dict) -> dict:
+    """Bản tóm tắt tin nhắn cuối lưu kèm hội thoại để hiển thị danh sách hội thoại"""
+    content = message.get("content") or ""
+    return {
+        "_id": message_id,
+        "sender_id": message["sender_id"],
+        "type": message.get("type", "text"),
+        "content": content[:PREVIEW_CONTENT_LENGTH],
+        "created_at": message["created_at"],
+    }
+
+def summary_updates(conversation_id: str, previews: List[dict]) -> List[UpdateOne]:
+    """Các lệnh cập nhật tin nhắn cuối và số tin chưa đọc cho một loạt tin nhắn mới của cùng hội thoại"""
+    latest = max(previews, key=lambda p: p["created_at"])
+    # Chỉ thay tin nhắn cuối nếu tin này mới hơn (các tin gửi đồng thời có thể ghi lệch thứ tự)
+    updates = [UpdateOne(
+        {
+            "_id": ObjectId(conversation_id),
+            "$or": [
+                {"last_message_at": None},
+                {"last_message_at": {"$lte": latest["created_at"]}},
+            ]
+        },
+        {"$set": {"last_message_at": latest["created_at"], "last_message": latest}}
+    )]
+
+    # Mỗi tin tăng số tin chưa đọc của mọi thành viên trừ người gửi. Thành viên của hội thoại cũ
+    # chưa có số đếm sẽ được đếm đầy đủ khi tạo tóm tắt (hoặc khi đọc), không cộng dở dang ở đây
+    sent_by = Counter(p["sender_id"] for p in previews)
+    for sender_id, count in sent_by.items():
+        updates.append(UpdateOne(
+            {"_id": ObjectId(conversation_id)},
+            {"$inc": {"members.$[other].unread_count": count}},
+            array_filters=[{"other.user_id": {"$ne": sender_id}, "other.unread_count": {"$exists": True}}]
+        ))
+    return updates
+
+async def record_new_message(db, conversation_id: str, preview: dict):
+    """Cập nhật tin nhắn cuối và số tin chưa đọc trong 1 lượt ghi"""
+    await db.conversations.bulk_write(summary_updates(conversation_id, [preview]), ordered=False)
+
+async def reset_summary(db, conversation_id: str):
+    """Gọi sau khi xóa toàn bộ tin nhắn của hội thoại"""
+    await db.conversations.update_one(
+        {"_id": ObjectId(conversation_id)},
+        {"$set": {
+            "last_message_at": None,
+            "last_message": None,
+            "members.$[].unread_count": 0,
+        }}
+    )
+
+def format_preview(preview: Optional[dict]) -> Optional[dict]:
+    if not preview:
+        return None
+    created_at = preview.get("created_at")
+    return {
+        "_id": preview["_id"],
+        "content": preview.get("content"),
+        "sender_id": preview["sender_id"],
+        "type": preview.get("type", "text"),
+        "created_at": created_at.isoformat() if created_at else None,
+    }
@@ -0,0 +1,42 @@
+import time
+from typing import FrozenSet
+from app.config import get_settings
+from .cache import TTLCache
+
+settings = get_settings()
+
+# user_id -> tập id bạn bè đã chấp nhận
+friend_cache = TTLCache(
+    "friend_ids",
+    maxsize=settings.FRIEND_CACHE_SIZE,
+    ttl=settings.FRIEND_CACHE_TTL,
+)
+
+async def get_friend_ids(db, user_id: str) -> FrozenSet[str]:
+    """Lấy tập id bạn bè của user (không giới hạn số lượng), ưu tiên từ cache"""
+    friend_ids = friend_cache.get(user_id)
+    if friend_ids is not None:
+        return friend_ids
+
+    started = time.perf_counter()
+    cursor = db.friendships.find({
+        "status": "accepted",
+        "$or": [
+            {"from_user_id": user_id},
+            {"to_user_id": user_id}
+        ]
+    }, {"from_user_id": 1, "to_user_id": 1})
+    friend_ids = frozenset([
+        fs["to_user_id"] if fs["from_user_id"] == user_id else fs["from_user_id"]
+        async for fs in cursor
+    ])
+    friend_cache.record_load(time.perf_counter() - started)
+    friend_cache.set(user_id, friend_ids)
+    return friend_ids
+
+async def are_friends(db, user1_id: str, user2_id: str) -> bool:
+    return user2_id in await get_friend_ids(db, user1_id)
+
+async def invalidate_friends(*user_ids: str):
+    """Gọi sau khi quan hệ bạn bè giữa các user thay đổi"""
+    await friend_cache.invalidate(*user_ids)
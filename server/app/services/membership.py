@@ -0,0 +1,36 @@
+from typing import Dict, Optional
+from bson import ObjectId
+from app.config import get_settings
+from .cache import TTLCache
+
+settings = get_settings()
+
+# conversation_id -> {user_id: role}
+membership_cache = TTLCache(
+    "conversation_members",
+    maxsize=settings.MEMBERSHIP_CACHE_SIZE,
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+)
+
+async def get_conversation_members(db, conversation_id: str) -> Optional[Dict[str, str]]:
+    """Lấy danh sách thành viên {user_id: role} của hội thoại, ưu tiên từ cache"""
+    members = membership_cache.get(conversation_id)
+    if members is not None:
+        return members
+
+    conversation = await db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"members.user_id": 1, "members.role": 1}
+    )
+    if not conversation:
+        return None
+
+    members = {m["user_id"]: m.get("role", "member") for m in conversation["members"]}
+    membership_cache.set(conversation_id, members)
+    return members
+
+def cache_conversation_members(conversation_id: str, members: list):
+    membership_cache.set(conversation_id, {m["user_id"]: m.get("role", "member") for m in members})
+
+async def invalidate_conversation_members(conversation_id: str):
+    await membership_cache.invalidate(conversation_id)
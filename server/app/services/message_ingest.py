@@ -0,0 +1,102 @@
+import asyncio
+from collections import defaultdict
+from typing import List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from app.config import get_settings
+from .conversation_summary import message_preview, summary_updates
+
+settings = get_settings()
+
+class MessageIngest:
+    """Gộp các tin nhắn gửi gần nhau thành 1 lần insert_many.
+
+    Tin nhắn được giữ tối đa MESSAGE_INGEST_BATCH_MS mili giây (hoặc tới khi đủ
+    MESSAGE_INGEST_MAX_BATCH tin) rồi ghi theo thứ tự. Người gửi chỉ nhận xác nhận
+    sau khi lô đã được ghi. Tin nhắn cuối và số tin chưa đọc của các hội thoại
+    trong lô được cập nhật bằng 1 lệnh bulk_write.
+    """
+
+    def __init__(self, batch_ms: float, max_batch: int):
+        self.delay = batch_ms / 1000
+        self.max_batch = max_batch
+        self._buffer: List[Tuple[dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.delay > 0
+
+    @property
+    def pending(self) -> int:
+        """Số tin nhắn đang chờ ghi theo lô"""
+        return len(self._buffer)
+
+    async def submit(self, db, message: dict):
+        """Đưa tin nhắn vào lô, trả về _id sau khi lô được ghi vào database"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._buffer.append((message, future))
+
+        if len(self._buffer) >= self.max_batch:
+            self._flush(db)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.delay, self._flush, db)
+        return await future
+
+    def _flush(self, db):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        if batch:
+            task = asyncio.create_task(self._write(db, batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, db, batch: List[Tuple[dict, asyncio.Future]]):
+        messages = [message for message, _ in batch]
+        inserted = len(messages)
+        error = None
+        try:
+            # insert_many gán _id cho từng document trước khi gửi đi
+            await db.messages.insert_many(messages, ordered=True)
+        except BulkWriteError as e:
+            # Ghi theo thứ tự: các tin trước tin lỗi đã được lưu
+            inserted = e.details.get("nInserted", 0)
+            error = e
+        except Exception as e:
+            inserted = 0
+            error = e
+
+        for index, (message, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index < inserted:
+                future.set_result(message["_id"])
+            else:
+                future.set_exception(error)
+
+        if inserted:
+            await self._update_summaries(db, messages[:inserted])
+
+    async def _update_summaries(self, db, messages: List[dict]):
+        previews = defaultdict(list)
+        for message in messages:
+            previews[message["conversation_id"]].append(message_preview(str(message["_id"]), message))
+
+        try:
+            updates = []
+            for conversation_id, items in previews.items():
+                updates += summary_updates(conversation_id, items)
+            await db.conversations.bulk_write(updates, ordered=False)
+        except Exception as e:
+            print(f"Lỗi cập nhật tóm tắt hội thoại: {e}")
+
+    async def drain(self, db):
+        """Ghi nốt các tin đang chờ, gọi khi tắt server"""
+        self._flush(db)
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+message_ingest = MessageIngest(settings.MESSAGE_INGEST_BATCH_MS, settings.MESSAGE_INGEST_MAX_BATCH)
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+
+def encode_cursor(data: dict) -> str:
+    """Mã hóa vị trí phân trang thành chuỗi cursor gửi cho client"""
+    raw = json.dumps(data, separators=(",", ":"), default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Giải mã cursor do client gửi lên, báo lỗi 400 nếu không hợp lệ"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        data = None
+    if not isinstance(data, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor không hợp lệ",
+        )
+    return data
+
+def parse_cursor_datetime(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor không hợp lệ",
+        )
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
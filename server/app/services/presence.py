@@ -0,0 +1,142 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.config import get_settings
+from app.database import get_database
+from app.websocket import manager
+from .friend_graph import get_friend_ids
+from .user_cache import invalidate_users
+
+settings = get_settings()
+
+class PresenceService:
+    """Trạng thái online/offline của user.
+
+    Chuyển trạng thái dựa trên tổng số kết nối của user trên mọi worker (đếm ở broker):
+    online khi có kết nối đầu tiên, offline sau một khoảng chờ kể từ khi mất kết nối cuối
+    cùng, nên kết nối chập chờn không sinh sự kiện. Các thay đổi được gộp lại rồi ghi vào
+    database và thông báo cho bạn bè theo lô, mỗi PRESENCE_FLUSH_INTERVAL giây.
+    """
+
+    def __init__(self):
+        self._offline_timers: Dict[str, asyncio.TimerHandle] = {}
+        # Thay đổi chưa ghi/thông báo: user_id -> (status, thời điểm)
+        self._changes: Dict[str, Tuple[str, datetime]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending(self) -> int:
+        """Số thay đổi trạng thái chưa ghi/thông báo"""
+        return len(self._changes)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Khi tắt server các kết nối đã đóng trước, user đang chờ offline không được để lại "online"
+        timers, self._offline_timers = self._offline_timers, {}
+        for user_id, timer in timers.items():
+            timer.cancel()
+            self._record(user_id, "offline")
+        # Ghi nốt các thay đổi còn lại, bỏ user vẫn còn kết nối ở worker khác
+        changes, self._changes = self._changes, {}
+        try:
+            await self._flush(await self._drop_reconnected(changes))
+        except Exception as e:
+            print(f"Lỗi cập nhật trạng thái online: {e}")
+
+    def user_connected(self, user_id: str, connections: int):
+        """connections: tổng số kết nối của user trên mọi worker, tính cả kết nối này"""
+        timer = self._offline_timers.pop(user_id, None)
+        if timer:
+            # Kết nối lại trong khoảng chờ: chưa từng báo offline nên không có gì thay đổi
+            timer.cancel()
+            return
+        if connections == 1:
+            self._record(user_id, "online")
+
+    async def user_disconnected(self, user_id: str, remaining: Optional[int]):
+        """remaining: số kết nối còn lại trên mọi worker, None nếu chưa biết"""
+        if remaining is None:
+            remaining = await manager.presence_count(user_id)
+        # Vẫn còn kết nối khác (kể cả ở worker khác)
+        if remaining > 0 or user_id in self._offline_timers:
+            return
+        loop = asyncio.get_running_loop()
+        self._offline_timers[user_id] = loop.call_later(
+            settings.PRESENCE_OFFLINE_GRACE, self._expire, user_id
+        )
+
+    def _expire(self, user_id: str):
+        self._offline_timers.pop(user_id, None)
+        asyncio.create_task(self._go_offline(user_id))
+
+    async def _go_offline(self, user_id: str):
+        if user_id in self._offline_timers or await manager.presence_count(user_id) > 0:
+            return
+        self._record(user_id, "offline")
+
+    def _record(self, user_id: str, status: str):
+        previous = self._changes.pop(user_id, None)
+        # Online rồi offline (hoặc ngược lại) trước khi kịp gửi đi thì bỏ qua cả hai
+        if previous is not None and previous[0] != status:
+            return
+        self._changes[user_id] = (status, datetime.now(timezone.utc))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            changes, self._changes = self._changes, {}
+            try:
+                await self._flush(await self._drop_reconnected(changes))
+            except Exception as e:
+                print(f"Lỗi cập nhật trạng thái online: {e}")
+
+    async def _drop_reconnected(self, changes: Dict[str, Tuple[str, datetime]]) -> Dict[str, Tuple[str, datetime]]:
+        """Bỏ các thay đổi offline của user đã kết nối lại (có thể ở worker khác) trong lúc chờ ghi"""
+        offline = [user_id for user_id, (status, _) in changes.items() if status == "offline"]
+        counts = await asyncio.gather(*(manager.presence_count(user_id) for user_id in offline))
+        for user_id, count in zip(offline, counts):
+            if count > 0:
+                del changes[user_id]
+        return changes
+
+    async def _flush(self, changes: Dict[str, Tuple[str, datetime]]):
+        if not changes:
+            return
+        db = get_database()
+        # Không ghi đè thay đổi mới hơn do worker khác ghi trước
+        await db.users.bulk_write([
+            UpdateOne(
+                {"_id": ObjectId(user_id), "$or": [{"last_online": None}, {"last_online": {"$lt": at}}]},
+                {"$set": {"status": status, "last_online": at}}
+            )
+            for user_id, (status, at) in changes.items()
+        ], ordered=False)
+        await invalidate_users(list(changes))
+
+        batch_size = settings.PRESENCE_FANOUT_BATCH
+        for user_id, (status, at) in changes.items():
+            payload = {"userId": user_id, "status": status}
+            if status == "offline":
+                payload["lastOnline"] = at.isoformat()
+            message = {"event": "user:status", "payload": payload}
+
+            friend_ids = list(await get_friend_ids(db, user_id))
+            for i in range(0, len(friend_ids), batch_size):
+                await manager.broadcast_to_users(message, friend_ids[i:i + batch_size])
+
+presence = PresenceService()
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from .conversation_summary import message_preview
+
+async def advance_read_cursor(
+    db,
+    conversation_id: str,
+    user_id: str,
+    message_id: str,
+    message_at: datetime,
+    is_latest: bool = False,
+) -> bool:
+    """Dời mốc đã đọc của thành viên tới tin nhắn message_id (chỉ tiến, không lùi).
+
+    Nếu is_latest (message_id là tin nhắn cuối của hội thoại) thì số tin chưa đọc về 0 khi chưa
+    có tin mới hơn, còn lại số tin chưa đọc được đếm lại sau mốc mới.
+    """
+    update = {"$set": {
+        "members.$[m].last_read_message_id": message_id,
+        "members.$[m].last_read_at": message_at,
+    }}
+    array_filters = [{
+        "m.user_id": user_id,
+        "$or": [
+            {"m.last_read_at": None},
+            {"m.last_read_at": {"$lt": message_at}},
+        ]
+    }]
+
+    if is_latest:
+        # Tin mới đến sau khi đọc tin nhắn cuối đã được $inc, không được xóa về 0
+        result = await db.conversations.update_one(
+            {"_id": ObjectId(conversation_id), "last_message._id": message_id},
+            {"$set": {**update["$set"], "members.$[me].unread_count": 0}},
+            array_filters=array_filters + [{"me.user_id": user_id}]
+        )
+        if result.matched_count > 0:
+            return result.modified_count > 0
+
+    result = await db.conversations.update_one(
+        {"_id": ObjectId(conversation_id)},
+        update,
+        array_filters=array_filters
+    )
+
+    if result.modified_count > 0:
+        unread = await db.messages.count_documents({
+            "conversation_id": conversation_id,
+            "created_at": {"$gt": message_at},
+            "sender_id": {"$ne": user_id},
+        })
+        # Bỏ qua nếu mốc đã được dời tiếp trong lúc đếm
+        await db.conversations.update_one(
+            {"_id": ObjectId(conversation_id)},
+            {"$set": {"members.$[m].unread_count": unread}},
+            array_filters=[{"m.user_id": user_id, "m.last_read_at": message_at}]
+        )
+    return result.modified_count > 0
+
+async def mark_conversation_read(db, conversation_id: str, user_id: str) -> Optional[dict]:
+    """Đánh dấu đã đọc toàn bộ hội thoại bằng cách dời mốc tới tin nhắn mới nhất"""
+    conversation = await db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"last_message": 1}
+    )
+    if not conversation:
+        return None
+    latest = conversation.get("last_message")
+    if "last_message" not in conversation:
+        # Hội thoại cũ chưa được tạo tóm tắt
+        message = await db.messages.find_one(
+            {"conversation_id": conversation_id},
+            {"sender_id": 1, "type": 1, "content": 1, "created_at": 1},
+            sort=[("created_at", -1), ("_id", -1)]
+        )
+        latest = message_preview(str(message["_id"]), message) if message else None
+    if not latest:
+        return None
+
+    await advance_read_cursor(db, conversation_id, user_id, latest["_id"], latest["created_at"], is_latest=True)
+    return latest
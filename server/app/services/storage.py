@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tempfile
+from typing import Dict, Tuple
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_CHUNK_SIZE = 64 * 1024  # 64KB
+# Phần thân multipart ngoài nội dung file (boundary, header của từng phần, tên file)
+MULTIPART_OVERHEAD = 64 * 1024
+
+def _too_large(max_size: int) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"File quá lớn (tối đa {max_size // (1024 * 1024)}MB)")
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+async def stream_to_temp(file: UploadFile, directory: str, max_size: int) -> Tuple[str, int, str]:
+    """Ghi file upload theo từng chunk vào file tạm, trả về (đường dẫn tạm, kích thước, sha256)"""
+    if file.size is not None and file.size > max_size:
+        raise _too_large(max_size)
+    
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    out = os.fdopen(fd, "wb")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise _too_large(max_size)
+            hasher.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+    except BaseException:
+        out.close()
+        remove_quietly(tmp_path)
+        raise
+    
+    return tmp_path, size, hasher.hexdigest()
+
+class UploadLimitMiddleware:
+    """ASGI middleware giới hạn kích thước thân request của các route upload.
+
+    FastAPI chỉ gọi route sau khi đã đọc hết form multipart vào file tạm, nên kiểm tra trong
+    route là quá muộn. Middleware từ chối ngay theo Content-Length, và đếm số byte nhận được
+    để ngắt request không khai báo (hoặc khai báo sai) kích thước khi vượt giới hạn.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        # Đường dẫn -> kích thước file tối đa
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_size = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if max_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_body = max_size + MULTIPART_OVERHEAD
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > max_body:
+                response = JSONResponse({"detail": _too_large(max_size).detail}, status_code=400)
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # Lỗi đi qua bộ parse form tới exception handler của FastAPI
+                    raise _too_large(max_size)
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -0,0 +1,31 @@
+import re
+import unicodedata
+from typing import List
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_NON_WORD_RE = re.compile(r"[^\w\s]")
+
+def normalize_text(text: str) -> str:
+    """Chuẩn hóa để tìm kiếm: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d), gộp khoảng trắng"""
+    if not text:
+        return ""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return _WHITESPACE_RE.sub(" ", stripped.lower()).strip()
+
+def tokenize(text: str) -> List[str]:
+    return _NON_WORD_RE.sub(" ", normalize_text(text)).split()
+
+def user_search_keys(username: str, display_name: str) -> List[str]:
+    """Các khóa tìm kiếm theo tiền tố của user: username và từng hậu tố theo từ của tên hiển thị"""
+    keys = [normalize_text(username)]
+    words = tokenize(display_name)
+    for i in range(len(words)):
+        keys.append(" ".join(words[i:]))
+    return list(dict.fromkeys(k for k in keys if k))
+
+def message_search_text(content, file_name) -> str:
+    """Nội dung được đánh chỉ mục của 1 tin nhắn"""
+    parts = [p for p in (content, file_name) if isinstance(p, str) and p]
+    return normalize_text(" ".join(parts))
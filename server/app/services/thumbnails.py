@@ -0,0 +1,153 @@
+import asyncio
+import base64
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from app.config import get_settings
+from .blob_store import BLOB_DIR, BLOB_URL_PREFIX, THUMBNAIL_WIDTHS, derivative_name
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+settings = get_settings()
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+PLACEHOLDER_WIDTH = 16
+AVATAR_SIZE = 256
+
+_executor: Optional[ProcessPoolExecutor] = None
+# Các blob đang được tạo ảnh thu nhỏ: blob_id -> task
+_pending: Dict[str, asyncio.Task] = {}
+
+def is_enabled() -> bool:
+    return Image is not None and settings.IMAGE_WORKERS > 0
+
+def pending_count() -> int:
+    """Số ảnh đang được tạo thumbnail"""
+    return len(_pending)
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Không fork: lúc này process đã có các thread (driver MongoDB, pool bcrypt, theo dõi event loop),
+        # process con fork ra có thể kẹt ở khóa mà thread khác đang giữ
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+# Các hàm dưới chạy trong process con, không truy cập event loop hay database
+
+def _render_derivatives(path: str, directory: str, blob_id: str) -> dict:
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        width, height = image.size
+
+        thumbnails = {}
+        for target in THUMBNAIL_WIDTHS:
+            if target >= width:
+                break
+            resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+            name = derivative_name(blob_id, target)
+            tmp_path = os.path.join(directory, name + ".part")
+            resized.save(tmp_path, "WEBP", quality=80)
+            os.replace(tmp_path, os.path.join(directory, name))
+            thumbnails[str(target)] = BLOB_URL_PREFIX + name
+
+        # Ảnh rất nhỏ dạng data URI để client hiển thị mờ trong lúc tải
+        tiny = image.convert("RGB").resize(
+            (PLACEHOLDER_WIDTH, max(1, round(height * PLACEHOLDER_WIDTH / width))),
+            Image.BILINEAR,
+        )
+        buffer = io.BytesIO()
+        tiny.save(buffer, "JPEG", quality=40)
+        placeholder = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+    return {"width": width, "height": height, "thumbnails": thumbnails, "placeholder": placeholder}
+
+def _render_avatar(src_path: str, dest_path: str):
+    with Image.open(src_path) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+        image = ImageOps.fit(image, (AVATAR_SIZE, AVATAR_SIZE), Image.LANCZOS)
+        tmp_path = dest_path + ".part"
+        image.save(tmp_path, "WEBP", quality=85)
+        os.replace(tmp_path, dest_path)
+
+async def _generate(db, blob_id: str) -> Optional[dict]:
+    loop = asyncio.get_running_loop()
+    try:
+        image = await loop.run_in_executor(
+            _get_executor(), _render_derivatives, os.path.join(BLOB_DIR, blob_id), BLOB_DIR, blob_id
+        )
+    except Exception:
+        # Không đọc được ảnh: vẫn gửi được như file thường
+        return None
+
+    image["generated_at"] = datetime.now(timezone.utc)
+    await db.blobs.update_one({"_id": blob_id}, {"$set": {"image": image}})
+    return image
+
+def schedule_derivatives(db, blob_id: str, file_ext: str):
+    """Tạo ảnh thu nhỏ ở background cho ảnh vừa upload"""
+    if not is_enabled() or file_ext not in IMAGE_EXTENSIONS or blob_id in _pending:
+        return
+
+    task = asyncio.create_task(_generate(db, blob_id))
+    _pending[blob_id] = task
+    task.add_done_callback(lambda _: _pending.pop(blob_id, None))
+
+async def wait_for_derivatives(blob_id: str, timeout: float) -> Optional[dict]:
+    """Chờ ảnh thu nhỏ đang tạo dở trong tối đa timeout giây"""
+    task = _pending.get(blob_id)
+    if task is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+def image_payload(image: Optional[dict]) -> Optional[dict]:
+    """Thông tin ảnh gửi kèm tin nhắn"""
+    if not image:
+        return None
+    return {
+        "width": image["width"],
+        "height": image["height"],
+        "thumbnails": image["thumbnails"],
+        "placeholder": image["placeholder"],
+    }
+
+async def wait_for_image(db, blob_id: str) -> Optional[dict]:
+    """Chờ ảnh thu nhỏ của blob ảnh đang tạo dở, đọc lại từ database nếu đã tạo xong"""
+    if not is_enabled() or os.path.splitext(blob_id)[1] not in IMAGE_EXTENSIONS:
+        return None
+    image = await wait_for_derivatives(blob_id, settings.THUMBNAIL_WAIT_SECONDS)
+    if image is None:
+        blob = await db.blobs.find_one({"_id": blob_id}, {"image": 1})
+        image = blob.get("image") if blob else None
+    return image_payload(image)
+
+async def render_avatar(src_path: str, dest_path: str) -> bool:
+    """Thu nhỏ avatar về AVATAR_SIZE, trả về False nếu không xử lý được"""
+    if not is_enabled():
+        return False
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_get_executor(), _render_avatar, src_path, dest_path)
+    except Exception:
+        return False
+    return True
@@ -0,0 +1,65 @@
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from app.config import get_settings
+from .cache import TTLCache
+
+settings = get_settings()
+
+# Các trường công khai dùng để hiển thị người dùng (tên, avatar, trạng thái)
+PROFILE_PROJECTION = {
+    "username": 1,
+    "display_name": 1,
+    "avatar_url": 1,
+    "status": 1,
+    "last_online": 1,
+}
+
+profile_cache = TTLCache(
+    "user_profiles",
+    maxsize=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+)
+
+# Document đầy đủ của user đã xác thực, dùng trong get_current_user
+auth_user_cache = TTLCache(
+    "auth_users",
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL,
+)
+
+async def get_user_profile(db, user_id: str) -> Optional[dict]:
+    """Lấy thông tin hiển thị của user, ưu tiên từ cache"""
+    profiles = await get_user_profiles(db, [user_id])
+    return profiles.get(user_id)
+
+async def get_user_profiles(db, user_ids: Iterable[str]) -> Dict[str, dict]:
+    """Lấy thông tin hiển thị của nhiều user, các user chưa có trong cache được tải bằng 1 truy vấn $in"""
+    profiles = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = profile_cache.get(user_id)
+        if profile is not None:
+            profiles[user_id] = profile
+        elif ObjectId.is_valid(user_id):
+            missing.append(ObjectId(user_id))
+
+    if missing:
+        cursor = db.users.find({"_id": {"$in": missing}}, PROFILE_PROJECTION)
+        async for user in cursor:
+            user_id = str(user["_id"])
+            user["_id"] = user_id
+            profile_cache.set(user_id, user)
+            profiles[user_id] = user
+
+    return profiles
+
+async def invalidate_user(user_id: str):
+    """Gọi sau mỗi lần cập nhật document user (avatar, tên, trạng thái)"""
+    await profile_cache.invalidate(user_id)
+    await auth_user_cache.invalidate(user_id)
+
+async def invalidate_users(user_ids: List[str]):
+    """Như invalidate_user nhưng cho nhiều user, chỉ gửi 1 thông báo cho mỗi cache"""
+    if user_ids:
+        await profile_cache.invalidate(*user_ids)
+        await auth_user_cache.invalidate(*user_ids)
@@ -1,14 +1,26 @@
 from datetime import datetime, timezone
 from bson import ObjectId
 
+def new_member(user_id: str, role: str) -> dict:
+    """Tạo bản ghi thành viên hội thoại kèm mốc đã đọc ban đầu"""
+    return {
+        "user_id": user_id,
+        "role": role,
+        "joined_at": datetime.now(timezone.utc),
+        "last_read_message_id": None,
+        "last_read_at": None,
+        "unread_count": 0,
+    }
+
 async def create_self_conversation(db, user_id: str):
     """Tạo cuộc hội thoại 'Cloud của tôi' cho user"""
     self_conversation = {
         "type": "self",
         "name": "Cloud của tôi",
-        "members": [{"user_id": user_id, "role": "admin", "joined_at": datetime.now(timezone.utc)}],
+        "members": [new_member(user_id, "admin")],
         "created_by": user_id,
         "created_at": datetime.now(timezone.utc),
         "last_message_at": None,
+        "last_message": None,
     }
     await db.conversations.insert_one(self_conversation)
@@ -1 +1,3 @@
 from .manager import manager, ConnectionManager
+from .connection import ClientConnection
+from .encoding import encode_frame
@@ -0,0 +1,237 @@
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+# Callback nhận (user_id, data) khi có tin nhắn từ worker khác gửi tới user
+MessageHandler = Callable[[str, str], Awaitable[None]]
+# Callback nhận thông báo nội bộ (vd. xóa cache) từ worker khác
+EventHandler = Callable[[str], Awaitable[None]]
+
+class Broker:
+    """Backend phân phối tin nhắn theo kênh của từng user giữa các worker/node"""
+
+    async def start(self, on_message: MessageHandler, on_event: Optional[EventHandler] = None):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, user_id: str):
+        pass
+
+    async def unsubscribe(self, user_id: str):
+        pass
+
+    async def publish(self, user_ids: Iterable[str], data: str):
+        pass
+
+    async def publish_event(self, data: str):
+        """Gửi thông báo nội bộ tới mọi worker khác"""
+        pass
+
+    async def add_presence(self, user_id: str) -> int:
+        """Ghi nhận 1 kết nối của user, trả về tổng số kết nối của user trên mọi worker"""
+        return 0
+
+    async def remove_presence(self, user_id: str) -> int:
+        """Bỏ 1 kết nối của user, trả về số kết nối còn lại trên mọi worker"""
+        return 0
+
+    async def presence_count(self, user_id: str) -> int:
+        return 0
+
+    async def is_online(self, user_id: str) -> bool:
+        return await self.presence_count(user_id) > 0
+
+class MemoryBroker(Broker):
+    """Chạy 1 process: mọi kết nối đều nằm trong ConnectionManager nên không cần phân phối thêm"""
+
+    def __init__(self):
+        self._presence: Dict[str, int] = {}
+
+    async def add_presence(self, user_id: str) -> int:
+        self._presence[user_id] = self._presence.get(user_id, 0) + 1
+        return self._presence[user_id]
+
+    async def remove_presence(self, user_id: str) -> int:
+        remaining = self._presence.get(user_id, 0) - 1
+        if remaining > 0:
+            self._presence[user_id] = remaining
+        else:
+            self._presence.pop(user_id, None)
+        return max(0, remaining)
+
+    async def presence_count(self, user_id: str) -> int:
+        return self._presence.get(user_id, 0)
+
+class RedisBroker(Broker):
+    """Phân phối qua Redis pub/sub (hoặc server tương thích giao thức Redis).
+
+    Số kết nối của user được lưu trong hash riêng của từng worker, có hạn sống và được
+    làm mới định kỳ, nên worker chết đột ngột không giữ user online mãi. Tổng số kết nối
+    là tổng trên hash của mọi worker trong danh sách workers.
+    """
+
+    def __init__(self, url: str, prefix: str = "alo", presence_ttl: float = 30.0):
+        self.url = url
+        self.prefix = prefix
+        self.presence_ttl = presence_ttl
+        # Đánh dấu tin nhắn do chính worker này publish để không gửi lặp
+        self.worker_id = uuid.uuid4().hex
+        self.redis = None
+        self.pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._on_message: Optional[MessageHandler] = None
+        self._on_event: Optional[EventHandler] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        # Bản sao số kết nối của worker này để ghi lại nếu hash đã hết hạn
+        self._presence: Dict[str, int] = {}
+
+    def _user_channel(self, user_id: str) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def _presence_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:presence:{worker_id}"
+
+    @property
+    def _workers_key(self) -> str:
+        return f"{self.prefix}:workers"
+
+    @property
+    def _control_channel(self) -> str:
+        return f"{self.prefix}:control"
+
+    async def start(self, on_message: MessageHandler, on_event: Optional[EventHandler] = None):
+        from redis import asyncio as aioredis
+
+        self._on_message = on_message
+        self._on_event = on_event
+        self.redis = aioredis.from_url(self.url, decode_responses=True)
+        self.pubsub = self.redis.pubsub()
+        # Kênh thông báo nội bộ, đồng thời giữ cho vòng lắng nghe luôn có ít nhất 1 kênh
+        await self.pubsub.subscribe(self._control_channel)
+        self._listener = asyncio.create_task(self._listen())
+        await self._refresh_presence()
+        self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        for task in (self._listener, self._heartbeat):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listener = self._heartbeat = None
+        if self.redis:
+            # Worker dừng bình thường thì bỏ ngay số kết nối của mình
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self._presence_key(self.worker_id))
+                pipe.zrem(self._workers_key, self.worker_id)
+                await pipe.execute()
+        if self.pubsub:
+            await self.pubsub.close()
+        if self.redis:
+            await self.redis.close()
+
+    async def _listen(self):
+        user_prefix = f"{self.prefix}:user:"
+        id_length = len(self.worker_id)
+        async for message in self.pubsub.listen():
+            if message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            raw = message["data"]
+            if raw[:id_length] == self.worker_id:
+                continue
+            try:
+                if channel.startswith(user_prefix):
+                    await self._on_message(channel[len(user_prefix):], raw[id_length:])
+                elif channel == self._control_channel and self._on_event:
+                    await self._on_event(raw[id_length:])
+            except Exception:
+                pass
+
+    async def subscribe(self, user_id: str):
+        await self.pubsub.subscribe(self._user_channel(user_id))
+
+    async def unsubscribe(self, user_id: str):
+        await self.pubsub.unsubscribe(self._user_channel(user_id))
+
+    async def publish(self, user_ids: Iterable[str], data: str):
+        payload = self.worker_id + data
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.publish(self._user_channel(user_id), payload)
+            await pipe.execute()
+
+    async def publish_event(self, data: str):
+        await self.redis.publish(self._control_channel, self.worker_id + data)
+
+    async def _refresh_presence(self):
+        """Gia hạn hash của worker này (ghi lại nếu đã hết hạn) và dọn worker đã chết khỏi danh sách"""
+        now = time.time()
+        key = self._presence_key(self.worker_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self._workers_key, {self.worker_id: now})
+            pipe.zremrangebyscore(self._workers_key, 0, now - self.presence_ttl)
+            pipe.pexpire(key, int(self.presence_ttl * 1000))
+            _, _, refreshed = await pipe.execute()
+        if not refreshed and self._presence:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping=self._presence)
+                pipe.pexpire(key, int(self.presence_ttl * 1000))
+                await pipe.execute()
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.presence_ttl / 3)
+            try:
+                await self._refresh_presence()
+            except Exception as e:
+                print(f"Lỗi gia hạn trạng thái online trên Redis: {e}")
+
+    async def _workers(self) -> List[str]:
+        workers = await self.redis.zrange(self._workers_key, 0, -1)
+        return workers if self.worker_id in workers else workers + [self.worker_id]
+
+    async def _change_presence(self, user_id: str, delta: int) -> int:
+        count = self._presence.get(user_id, 0) + delta
+        if count > 0:
+            self._presence[user_id] = count
+        else:
+            self._presence.pop(user_id, None)
+
+        key = self._presence_key(self.worker_id)
+        workers = await self._workers()
+        # Đổi số của worker này và đọc số của mọi worker trong cùng 1 transaction
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if count > 0:
+                pipe.hset(key, user_id, count)
+            else:
+                pipe.hdel(key, user_id)
+            pipe.pexpire(key, int(self.presence_ttl * 1000))
+            for worker_id in workers:
+                pipe.hget(self._presence_key(worker_id), user_id)
+            results = await pipe.execute()
+        return sum(int(value) for value in results[2:] if value)
+
+    async def add_presence(self, user_id: str) -> int:
+        return await self._change_presence(user_id, 1)
+
+    async def remove_presence(self, user_id: str) -> int:
+        return await self._change_presence(user_id, -1)
+
+    async def presence_count(self, user_id: str) -> int:
+        workers = await self._workers()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for worker_id in workers:
+                pipe.hget(self._presence_key(worker_id), user_id)
+            results = await pipe.execute()
+        return sum(int(value) for value in results if value)
+
+def create_broker(url: str, presence_ttl: float = 30.0) -> Broker:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url, presence_ttl=presence_ttl)
+    return MemoryBroker()
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from fastapi import WebSocket
+
+# Mã đóng kết nối khi client nhận quá chậm (1013 = Try Again Later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+class ClientConnection:
+    """Một kết nối WebSocket kèm hàng đợi gửi có giới hạn và task ghi riêng.
+
+    Broadcast chỉ đưa frame vào hàng đợi, task ghi sẽ gửi dần ra mạng nên
+    một client chậm không làm chậm các client khác.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        high_watermark: int,
+        low_watermark: int,
+        max_size: int,
+        slow_timeout: float,
+        on_evict: Optional[Callable[["ClientConnection"], None]] = None,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_size = max_size
+        self.slow_timeout = slow_timeout
+        self.on_evict = on_evict
+        # Mỗi phần tử là [coalesce_key, frame] để có thể thay frame tại chỗ
+        self._queue: deque = deque()
+        self._pending: Dict[str, list] = {}
+        self._wakeup = asyncio.Event()
+        self._slow_since: Optional[float] = None
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.dropped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        self._writer = asyncio.create_task(self._run())
+
+    def enqueue(self, frame: str, coalesce_key: Optional[str] = None, droppable: bool = False) -> bool:
+        """Đưa frame vào hàng đợi, trả về False nếu frame bị bỏ"""
+        if self.closed:
+            return False
+
+        # Gộp với frame cùng loại đang chờ gửi, chỉ giữ bản mới nhất
+        if coalesce_key is not None:
+            entry = self._pending.get(coalesce_key)
+            if entry is not None:
+                entry[1] = frame
+                return True
+
+        depth = len(self._queue)
+        if depth >= self.high_watermark:
+            now = time.monotonic()
+            if self._slow_since is None:
+                self._slow_since = now
+            if depth >= self.max_size or now - self._slow_since > self.slow_timeout:
+                self.evict()
+                return False
+            if droppable:
+                self.dropped += 1
+                return False
+
+        entry = [coalesce_key, frame]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = entry
+        self._wakeup.set()
+        return True
+
+    async def _run(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+
+                entry = self._queue.popleft()
+                key = entry[0]
+                if key is not None and self._pending.get(key) is entry:
+                    del self._pending[key]
+
+                await self.websocket.send_text(entry[1])
+
+                if self._slow_since is not None and len(self._queue) <= self.low_watermark:
+                    self._slow_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Socket đã hỏng, vòng nhận ở main.py sẽ dọn dẹp
+            self.closed = True
+            self._queue.clear()
+            self._pending.clear()
+
+    def evict(self):
+        """Ngắt client nhận quá chậm"""
+        if self.closed:
+            return
+        self.close()
+        if self.on_evict:
+            self.on_evict(self)
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE), timeout=5)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._writer and not self._writer.done():
+            self._writer.cancel()
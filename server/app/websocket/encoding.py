@@ -0,0 +1,18 @@
+import json
+from typing import Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Frame đã mã hóa sẵn (str) hoặc message dạng dict
+Message = Union[dict, str]
+
+def encode_frame(message: Message) -> str:
+    """Mã hóa message thành text frame một lần để gửi cho mọi kết nối"""
+    if isinstance(message, str):
+        return message
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
@@ -1,48 +1,138 @@
 from fastapi import WebSocket
-from typing import Dict, List
-import json
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import asyncio
+import json
+from app.config import get_settings
+from app.metrics import WS_CONNECTIONS_OPENED, WS_EVICTIONS, WS_FANOUT_SIZE
+from .broker import Broker, create_broker
+from .connection import ClientConnection
+from .encoding import Message, encode_frame
+
+# Sự kiện chỉ cần giữ bản mới nhất: event -> có thể bỏ khi client nghẽn hay không
+COALESCED_EVENTS = {
+    "user:typing": True,
+    "user:status": False,
+}
+
+def _coalesce_options(message: Message) -> Tuple[Optional[str], bool]:
+    if not isinstance(message, dict):
+        return None, False
+    event = message.get("event")
+    if event not in COALESCED_EVENTS:
+        return None, False
+    payload = message.get("payload") or {}
+    key = f"{event}:{payload.get('conversationId', '')}:{payload.get('userId', '')}"
+    return key, COALESCED_EVENTS[event]
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: str):
+    def __init__(self, broker: Optional[Broker] = None):
+        self.active_connections: Dict[str, List[ClientConnection]] = {}
+        settings = get_settings()
+        self.broker = broker or create_broker(settings.BROKER_URL, settings.BROKER_PRESENCE_TTL)
+        self._event_handlers: Dict[str, Callable[[dict], Awaitable[None]]] = {}
+
+    async def start(self):
+        await self.broker.start(self._deliver_local, self._handle_event)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> Tuple[ClientConnection, int]:
+        """Nhận kết nối, trả về (kết nối, tổng số kết nối của user trên mọi worker)"""
+        settings = get_settings()
         await websocket.accept()
+        connection = ClientConnection(
+            websocket,
+            user_id,
+            high_watermark=settings.WS_SEND_QUEUE_HIGH_WATERMARK,
+            low_watermark=settings.WS_SEND_QUEUE_LOW_WATERMARK,
+            max_size=settings.WS_SEND_QUEUE_MAX_SIZE,
+            slow_timeout=settings.WS_SLOW_CONSUMER_TIMEOUT,
+            on_evict=self._on_evict,
+        )
+        connection.start()
+        WS_CONNECTIONS_OPENED.inc()
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, user_id: str):
+            await self.broker.subscribe(user_id)
+        self.active_connections[user_id].append(connection)
+        total = await self.broker.add_presence(user_id)
+        return connection, total
+
+    async def disconnect(self, websocket: WebSocket, user_id: str) -> Optional[int]:
+        """Đóng kết nối, trả về số kết nối còn lại của user trên mọi worker (None nếu kết nối đã được gỡ trước đó)"""
+        remaining = None
         if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
+            for connection in self.active_connections[user_id]:
+                if connection.websocket is websocket:
+                    connection.close()
+                    self.active_connections[user_id].remove(connection)
+                    remaining = await self.broker.remove_presence(user_id)
+                    break
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
-    
-    async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            tasks = []
-            for connection in self.active_connections[user_id]:
-                try:
-                    tasks.append(connection.send_json(message))
-                except:
-                    pass
-            
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
-    
-    async def broadcast_to_users(self, message: dict, user_ids: List[str]):
-        tasks = []
+                await self.broker.unsubscribe(user_id)
+        return remaining
+
+    def _on_evict(self, connection: ClientConnection):
+        WS_EVICTIONS.inc()
+        asyncio.create_task(self.disconnect(connection.websocket, connection.user_id))
+
+    def _enqueue(self, user_id: str, frame: str, coalesce_key: Optional[str] = None, droppable: bool = False):
+        for connection in self.active_connections.get(user_id, ()):
+            connection.enqueue(frame, coalesce_key, droppable)
+
+    async def _deliver_local(self, user_id: str, data: str):
+        """Đưa frame từ worker khác vào hàng đợi các kết nối của user trên worker này"""
+        self._enqueue(user_id, data)
+
+    async def send_personal_message(self, message: Message, user_id: str):
+        await self.broadcast_to_users(message, [user_id])
+
+    async def broadcast_to_users(self, message: Message, user_ids: List[str]):
+        # Mã hóa 1 lần, dùng chung frame cho mọi socket và cho broker
+        frame = encode_frame(message)
+        coalesce_key, droppable = _coalesce_options(message)
+        WS_FANOUT_SIZE.observe(len(user_ids))
+
+        # Chỉ xếp hàng, không chờ gửi qua mạng
         for user_id in user_ids:
-            if user_id in self.active_connections:
-                for connection in self.active_connections[user_id]:
-                    tasks.append(connection.send_json(message))
-        
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
-    
-    def is_user_online(self, user_id: str) -> bool:
-        return user_id in self.active_connections and len(self.active_connections[user_id]) > 0
-
-manager = ConnectionManager()
\ No newline at end of file
+            self._enqueue(user_id, frame, coalesce_key, droppable)
+
+        # User có thể đang kết nối tới worker khác
+        await self.broker.publish(user_ids, frame)
+
+    def add_event_handler(self, topic: str, handler: Callable[[dict], Awaitable[None]]):
+        """Đăng ký xử lý thông báo nội bộ từ worker khác"""
+        self._event_handlers[topic] = handler
+
+    async def publish_event(self, topic: str, data: dict):
+        await self.broker.publish_event(json.dumps({"topic": topic, "data": data}))
+
+    async def _handle_event(self, raw: str):
+        event = json.loads(raw)
+        handler = self._event_handlers.get(event.get("topic"))
+        if handler:
+            await handler(event.get("data") or {})
+
+    def queue_stats(self) -> Tuple[int, int, int]:
+        """(tổng frame đang chờ, hàng đợi dài nhất, tổng frame đã bỏ) trên các kết nối của worker này"""
+        total = longest = dropped = 0
+        for connections in self.active_connections.values():
+            for connection in connections:
+                depth = connection.queue_depth
+                total += depth
+                longest = max(longest, depth)
+                dropped += connection.dropped
+        return total, longest, dropped
+
+    async def presence_count(self, user_id: str) -> int:
+        """Tổng số kết nối của user trên mọi worker"""
+        return await self.broker.presence_count(user_id)
+
+    async def is_user_online(self, user_id: str) -> bool:
+        if user_id in self.active_connections and len(self.active_connections[user_id]) > 0:
+            return True
+        return await self.broker.is_online(user_id)
+
+manager = ConnectionManager()
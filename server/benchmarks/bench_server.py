@@ -0,0 +1,71 @@
+"""Chạy server kèm dữ liệu benchmark (users, token, nhóm chat) trên một database riêng.
+
+    python benchmarks/bench_server.py --port 8765 --users 2000 --tokens-file /tmp/bench_tokens.json
+
+Mặc định dùng MongoDB tại MONGODB_URL với database alo_chat_bench (bị xóa khi khởi động).
+--in-memory dùng mongomock-motor thay cho MongoDB (pip install mongomock-motor): tiện để đo phần
+WebSocket/fan-out mà không cần MongoDB, nhưng không hỗ trợ array_filters và text index nên
+các thao tác ghi tóm tắt hội thoại/đã đọc sẽ lỗi và độ trễ database không phản ánh thực tế.
+"""
+import argparse
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db-name", default="alo_chat_bench")
+    parser.add_argument("--in-memory", action="store_true")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument("--friends", type=int, default=20)
+    parser.add_argument("--tokens-file", required=True)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Settings được đọc khi import app nên phải đặt biến môi trường trước
+    os.chdir(SERVER_DIR)
+    sys.path.insert(0, SERVER_DIR)
+    os.environ["MONGODB_DB_NAME"] = args.db_name
+
+    from app import database
+    if args.in_memory:
+        from mongomock_motor import AsyncMongoMockClient
+        database.AsyncIOMotorClient = lambda url, **kwargs: AsyncMongoMockClient(**kwargs)
+    else:
+        from pymongo import MongoClient
+        from app.config import get_settings
+        with MongoClient(get_settings().MONGODB_URL) as client:
+            client.drop_database(args.db_name)
+
+    import uvicorn
+    from main import app
+    from fixtures import create_ws_fixtures
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def bench_lifespan(app_):
+        async with app_lifespan(app_):
+            fixtures = await create_ws_fixtures(
+                database.get_database(), args.users, args.group_size, args.friends
+            )
+            fixtures["server_pid"] = os.getpid()
+            tmp_path = args.tokens_file + ".part"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(fixtures, f)
+            os.replace(tmp_path, args.tokens_file)
+            yield
+
+    app.router.lifespan_context = bench_lifespan
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", ws_max_queue=1024)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Hàm dùng chung cho các script đo hiệu năng."""
+import json
+import urllib.error
+import urllib.request
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples) if samples else None,
+    }
+
+def request_json(url, method="GET", body=None, token=None, timeout=60):
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode("utf-8") if body is not None else None,
+        headers=headers,
+        method=method,
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return {"error": e.code}
+
+def login(url, username, password):
+    return request_json(f"{url}/api/auth/login", "POST", {"username": username, "password": password})
+
+def ws_url(url, token):
+    return url.replace("http", "ws", 1) + f"/ws?token={token}"
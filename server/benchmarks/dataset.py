@@ -0,0 +1,293 @@
+"""Sinh bộ dữ liệu lớn để đo hiệu năng theo quy mô (users, bạn bè, hội thoại, tin nhắn).
+
+Document có cùng cấu trúc với dữ liệu thật (xem benchmarks/fixtures.py). Phân bố lệch như thực tế:
+- Số bạn bè theo luật lũy thừa (vài user có rất nhiều bạn).
+- Kích thước nhóm theo phân phối Pareto (đa số nhóm nhỏ, vài nhóm hàng nghìn người).
+- Tin nhắn dồn vào một số hội thoại "nóng" theo phân phối Zipf.
+
+    python benchmarks/dataset.py --users 10000 --groups 500 --messages 1000000 --sample-file sample.json
+    python benchmarks/dataset.py --users 1000000 --groups 50000 --messages 100000000 --db-name alo_chat_scale
+
+Dữ liệu được ghi thẳng vào MongoDB (mặc định MONGODB_URL, database alo_chat_scale). Sau đó chạy server
+với MONGODB_DB_NAME trỏ tới database này (index được tạo khi server khởi động) và đo bằng
+benchmarks/rest_bench.py --sample-file sample.json. Cần khoảng vài trăm byte RAM cho mỗi hội thoại
+và mỗi cặp bạn bè trong lúc sinh dữ liệu.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Đọc .env (JWT_SECRET_KEY, MONGODB_URL) giống server để token trong file mẫu dùng được
+CALLER_DIR = os.getcwd()
+os.chdir(SERVER_DIR)
+sys.path.insert(0, SERVER_DIR)
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from app.config import get_settings
+from app.services import create_access_token, get_password_hash
+from app.services.conversation_summary import message_preview
+from app.services.text_search import normalize_text
+from fixtures import BENCH_PASSWORD, conversation_doc, friendship_doc, message_doc, user_doc
+
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương", "Lý"]
+MIDDLE_NAMES = ["Văn", "Thị", "Hữu", "Đức", "Thanh", "Minh", "Ngọc", "Quốc", "Gia", "Thu", "Hoài", ""]
+GIVEN_NAMES = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Hải", "Hạnh", "Hiếu", "Hòa", "Hùng", "Hương", "Khánh", "Lan",
+               "Linh", "Long", "Mai", "Nam", "Nga", "Phúc", "Phương", "Quân", "Sơn", "Tâm", "Thảo", "Trang", "Trung", "Tú", "Vy", "Yến"]
+WORDS = ("ok nhé mai gặp lúc mấy giờ đi ăn trưa không họp lại tài liệu gửi rồi cảm ơn bạn nhiều hôm nay "
+         "trời đẹp quá deploy xong chưa kiểm tra giúp mình cái này được đó chúc mừng sinh nhật haha đang bận "
+         "để sau nha xem file đính kèm link đây nhớ mang theo laptop cuối tuần về quê").split()
+
+def log(message):
+    print(f"[{time.strftime('%H:%M:%S')}] {message}", file=sys.stderr, flush=True)
+
+def random_name(rng):
+    parts = [rng.choice(FAMILY_NAMES), rng.choice(MIDDLE_NAMES), rng.choice(GIVEN_NAMES)]
+    return " ".join(p for p in parts if p)
+
+def random_content(rng):
+    return " ".join(rng.choices(WORDS, k=rng.randint(2, 15)))
+
+def cumulative(weights):
+    total = 0.0
+    result = []
+    for w in weights:
+        total += w
+        result.append(total)
+    return result
+
+def insert_batches(collection, docs, batch_size):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+class Dataset:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.start = datetime.now(timezone.utc) - timedelta(days=args.days)
+        self.user_ids = []
+        self.display_names = []
+        self.friend_counts = array("I")
+        # Mỗi hội thoại: (ObjectId, type, tuple chỉ số thành viên)
+        self.conversations = []
+
+    def created_at(self):
+        return self.start + timedelta(seconds=self.rng.random() * self.args.days * 86400)
+
+    def generate_users(self, db):
+        args = self.args
+        password_hash = get_password_hash(BENCH_PASSWORD)
+        self.friend_counts = array("I", [0]) * args.users
+
+        def docs():
+            for i in range(args.users):
+                _id = ObjectId()
+                name = random_name(self.rng)
+                self.user_ids.append(str(_id))
+                self.display_names.append(name)
+                doc = user_doc(f"user{i}", name, password_hash, self.start)
+                doc["_id"] = _id
+                yield doc
+                if (i + 1) % 100000 == 0:
+                    log(f"users: {i + 1}/{args.users}")
+
+        insert_batches(db.users, docs(), args.batch_size)
+        for user_index in range(args.users):
+            self.conversations.append((ObjectId(), "self", (user_index,)))
+
+    def generate_friendships(self, db):
+        """Ghép cặp theo trọng số Pareto của từng user (kiểu Chung-Lu) để số bạn bè phân bố lệch"""
+        args = self.args
+        n = args.users
+        target = n * args.avg_friends // 2
+        cum = cumulative(self.rng.paretovariate(args.friend_alpha) for _ in range(n))
+        pairs = set()
+
+        def docs():
+            attempts = 0
+            while len(pairs) < target and attempts < target * 3:
+                chunk = min(100000, (target - len(pairs)) * 2)
+                a_list = self.rng.choices(range(n), cum_weights=cum, k=chunk)
+                b_list = self.rng.choices(range(n), cum_weights=cum, k=chunk)
+                attempts += chunk
+                for a, b in zip(a_list, b_list):
+                    if a == b:
+                        continue
+                    key = a * n + b if a < b else b * n + a
+                    if key in pairs:
+                        continue
+                    pairs.add(key)
+                    self.friend_counts[a] += 1
+                    self.friend_counts[b] += 1
+                    if self.rng.random() < args.private_ratio:
+                        self.conversations.append((ObjectId(), "private", (a, b)))
+                    yield friendship_doc(self.user_ids[a], self.user_ids[b], self.created_at())
+                    if len(pairs) >= target:
+                        break
+                log(f"friendships: {len(pairs)}/{target}")
+
+        insert_batches(db.friendships, docs(), args.batch_size)
+
+    def generate_groups(self):
+        args = self.args
+        max_size = min(args.max_group_size, args.users)
+        for _ in range(args.groups):
+            size = min(max_size, max(3, int(3 * self.rng.paretovariate(args.group_alpha))))
+            self.conversations.append((ObjectId(), "group", tuple(self.rng.sample(range(args.users), size))))
+
+    def generate_messages(self, db):
+        """Sinh tin nhắn, trả về tóm tắt của từng hội thoại: tin cuối và số tin theo người gửi"""
+        args = self.args
+        # Hội thoại self không có tin nhắn, thứ hạng "nóng" được xáo ngẫu nhiên
+        candidates = [i for i, c in enumerate(self.conversations) if c[1] != "self"]
+        self.rng.shuffle(candidates)
+        cum = cumulative(1 / (rank + 1) ** args.hot_alpha for rank in range(len(candidates)))
+        summaries = {}
+
+        def docs():
+            produced = 0
+            while produced < args.messages:
+                chunk = min(args.batch_size, args.messages - produced)
+                for index in self.rng.choices(candidates, cum_weights=cum, k=chunk):
+                    _id, _, members = self.conversations[index]
+                    sender = self.user_ids[self.rng.choice(members)]
+                    message = message_doc(str(_id), sender, random_content(self.rng), self.created_at())
+                    message["_id"] = ObjectId()
+
+                    summary = summaries.get(index)
+                    if summary is None:
+                        summary = summaries[index] = {"last": None, "senders": Counter(), "total": 0}
+                    summary["total"] += 1
+                    summary["senders"][sender] += 1
+                    if summary["last"] is None or message["created_at"] > summary["last"]["created_at"]:
+                        summary["last"] = message_preview(str(message["_id"]), message)
+                    yield message
+                produced += chunk
+                if produced % 1000000 < chunk:
+                    log(f"messages: {produced}/{args.messages}")
+
+        if args.messages and candidates:
+            insert_batches(db.messages, docs(), args.batch_size)
+        return summaries
+
+    def conversation_docs(self, summaries):
+        for index, (_id, conversation_type, members) in enumerate(self.conversations):
+            member_ids = [self.user_ids[m] for m in members]
+            name = f"Nhóm {index}" if conversation_type == "group" else ("Cloud của tôi" if conversation_type == "self" else None)
+            doc = conversation_doc(conversation_type, name, member_ids, self.start)
+            doc["_id"] = _id
+
+            summary = summaries.get(index)
+            if summary:
+                last = summary["last"]
+                doc["last_message"] = last
+                doc["last_message_at"] = last["created_at"]
+                for member in doc["members"]:
+                    # Một phần thành viên đã đọc hết, số còn lại chưa đọc tin nào của người khác
+                    if self.rng.random() < self.args.read_ratio:
+                        member["last_read_message_id"] = last["_id"]
+                        member["last_read_at"] = last["created_at"]
+                        member["unread_count"] = 0
+                    else:
+                        member["unread_count"] = summary["total"] - summary["senders"][member["user_id"]]
+            yield doc
+
+    def sample(self, summaries):
+        """Chọn user đại diện để đo: nhiều bạn bè nhất, thành viên nhóm lớn nhất, và ngẫu nhiên"""
+        args = self.args
+        count = args.sample_users
+        by_friends = sorted(range(args.users), key=lambda i: self.friend_counts[i], reverse=True)
+        chosen = {}
+        for i in by_friends[:max(1, count // 4)]:
+            chosen.setdefault(i, "most_friends")
+        groups = sorted(
+            (c for c in self.conversations if c[1] == "group"), key=lambda c: len(c[2]), reverse=True
+        )
+        if groups:
+            for i in groups[0][2][:max(1, count // 4)]:
+                chosen.setdefault(i, "largest_group")
+        while len(chosen) < min(count, args.users):
+            chosen.setdefault(self.rng.randrange(args.users), "random")
+
+        # Hội thoại có nhiều tin nhắn nhất của từng user được chọn
+        hottest = {}
+        for index, (_id, _, members) in enumerate(self.conversations):
+            total = summaries.get(index, {}).get("total", 0)
+            if not total:
+                continue
+            for m in members:
+                if m in chosen and total > hottest.get(m, (0, None))[0]:
+                    hottest[m] = (total, str(_id))
+
+        result = []
+        for i, kind in chosen.items():
+            other = self.display_names[self.rng.randrange(args.users)]
+            result.append({
+                "id": self.user_ids[i],
+                "token": create_access_token({"sub": self.user_ids[i]}, expires_delta=timedelta(days=30)),
+                "kind": kind,
+                "friend_count": self.friend_counts[i],
+                "conversation_id": hottest.get(i, (0, None))[1],
+                "search_prefix": normalize_text(other.split()[-1])[:3],
+                "search_term": self.rng.choice(WORDS),
+            })
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=None, help="Mặc định MONGODB_URL trong .env")
+    parser.add_argument("--db-name", default="alo_chat_scale")
+    parser.add_argument("--drop", action="store_true", help="Xóa database trước khi sinh dữ liệu")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--avg-friends", type=int, default=20)
+    parser.add_argument("--friend-alpha", type=float, default=2.0, help="Số mũ Pareto của số bạn bè (nhỏ hơn = lệch hơn)")
+    parser.add_argument("--private-ratio", type=float, default=0.2, help="Tỉ lệ cặp bạn bè có hội thoại riêng")
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--group-alpha", type=float, default=1.3, help="Số mũ Pareto của kích thước nhóm")
+    parser.add_argument("--max-group-size", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--hot-alpha", type=float, default=1.1, help="Số mũ Zipf của số tin nhắn theo hội thoại")
+    parser.add_argument("--read-ratio", type=float, default=0.8, help="Tỉ lệ thành viên đã đọc hết tin nhắn")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sample-users", type=int, default=200)
+    parser.add_argument("--sample-file", default="sample.json")
+    args = parser.parse_args()
+    sample_file = os.path.join(CALLER_DIR, args.sample_file)
+
+    client = MongoClient(args.mongo_url or get_settings().MONGODB_URL, tz_aware=True)
+    if args.drop:
+        client.drop_database(args.db_name)
+    db = client[args.db_name]
+
+    started = time.perf_counter()
+    dataset = Dataset(args)
+    dataset.generate_users(db)
+    dataset.generate_friendships(db)
+    dataset.generate_groups()
+    log(f"conversations: {len(dataset.conversations)}")
+    summaries = dataset.generate_messages(db)
+    insert_batches(db.conversations, dataset.conversation_docs(summaries), args.batch_size)
+
+    with open(sample_file, "w", encoding="utf-8") as f:
+        json.dump({"db_name": args.db_name, "users": dataset.sample(summaries)}, f, ensure_ascii=False, indent=2)
+    client.close()
+    log(f"xong sau {time.perf_counter() - started:.0f}s, mẫu user ghi ở {sample_file} (mật khẩu: {BENCH_PASSWORD})")
+
+if __name__ == "__main__":
+    main()
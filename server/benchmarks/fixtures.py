@@ -0,0 +1,98 @@
+"""Tạo dữ liệu cho benchmark theo đúng cấu trúc document của server (xem app/seed.py, app/services/user_helper.py)."""
+from datetime import datetime, timezone
+
+from app.services import create_access_token, get_password_hash
+from app.services.text_search import message_search_text, user_search_keys
+from app.services.user_helper import new_member
+
+BENCH_PASSWORD = "bench-password"
+
+def user_doc(username, display_name, password_hash, created_at):
+    return {
+        "username": username,
+        "display_name": display_name,
+        "search_keys": user_search_keys(username, display_name),
+        "password_hash": password_hash,
+        "avatar_url": None,
+        "status": "offline",
+        "created_at": created_at,
+        "last_online": None,
+    }
+
+def conversation_doc(conversation_type, name, member_ids, created_at):
+    members = [new_member(user_id, "admin" if i == 0 else "member") for i, user_id in enumerate(member_ids)]
+    for member in members:
+        member["joined_at"] = created_at
+    return {
+        "type": conversation_type,
+        "name": name,
+        "members": members,
+        "created_by": member_ids[0],
+        "created_at": created_at,
+        "last_message_at": None,
+        "last_message": None,
+    }
+
+def friendship_doc(from_user_id, to_user_id, created_at):
+    return {
+        "from_user_id": from_user_id,
+        "to_user_id": to_user_id,
+        "status": "accepted",
+        "created_at": created_at,
+        "accepted_at": created_at,
+        "rejected_at": None,
+    }
+
+def message_doc(conversation_id, sender_id, content, created_at):
+    return {
+        "conversation_id": conversation_id,
+        "sender_id": sender_id,
+        "content": content,
+        "type": "text",
+        "file_url": None,
+        "file_name": None,
+        "image": None,
+        "search_text": message_search_text(content, None),
+        "status": [{"user_id": sender_id, "status": "sent", "at": created_at}],
+        "created_at": created_at,
+    }
+
+async def insert_in_batches(collection, docs, batch_size=10000):
+    ids = []
+    for i in range(0, len(docs), batch_size):
+        result = await collection.insert_many(docs[i:i + batch_size], ordered=False)
+        ids += [str(_id) for _id in result.inserted_ids]
+    return ids
+
+async def create_ws_fixtures(db, users, group_size, friends, prefix="bench"):
+    """Tạo users kèm token, chia thành các nhóm group_size người, mỗi user kết bạn với friends người cùng nhóm"""
+    now = datetime.now(timezone.utc)
+    # Băm mật khẩu 1 lần dùng chung cho mọi tài khoản benchmark
+    password_hash = get_password_hash(BENCH_PASSWORD)
+    run_id = now.strftime("%Y%m%d%H%M%S")
+
+    user_ids = await insert_in_batches(db.users, [
+        user_doc(f"{prefix}_{run_id}_{i}", f"Bench {i}", password_hash, now)
+        for i in range(users)
+    ])
+    await insert_in_batches(db.conversations, [
+        conversation_doc("self", "Cloud của tôi", [user_id], now) for user_id in user_ids
+    ])
+
+    groups = [user_ids[i:i + group_size] for i in range(0, len(user_ids), group_size)]
+    group_ids = await insert_in_batches(db.conversations, [
+        conversation_doc("group", f"Bench group {i}", members, now) for i, members in enumerate(groups)
+    ])
+
+    friendships = []
+    for members in groups:
+        for i, user_id in enumerate(members):
+            for j in range(1, min(friends, len(members) - 1) // 2 + 1):
+                friendships.append(friendship_doc(user_id, members[(i + j) % len(members)], now))
+    if friendships:
+        await insert_in_batches(db.friendships, friendships)
+
+    return {
+        "users": [{"id": user_id, "token": create_access_token({"sub": user_id})} for user_id in user_ids],
+        "groups": [{"id": group_id, "members": members} for group_id, members in zip(group_ids, groups)],
+    }
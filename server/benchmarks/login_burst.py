@@ -0,0 +1,97 @@
+"""Đo độ trễ ping WebSocket khi có nhiều lượt đăng nhập cùng lúc.
+
+Chạy với server đang hoạt động và một tài khoản có sẵn:
+
+    python benchmarks/login_burst.py --url http://localhost:8000 --username admin --password 123456
+
+Kết quả in ra dạng JSON: phân vị độ trễ ping trước (baseline) và trong lúc có burst đăng nhập.
+Nếu bcrypt chặn event loop, độ trễ ping trong burst sẽ tăng vọt theo số lượt đăng nhập.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+
+from common import login, summarize, ws_url
+
+async def ping_loop(websocket, interval, samples, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await websocket.send(json.dumps({"event": "ping", "data": {}}))
+        while True:
+            message = json.loads(await websocket.recv())
+            if message.get("event") == "pong":
+                break
+        samples.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+
+async def measure(websocket, interval, duration):
+    samples = []
+    stop = asyncio.Event()
+    task = asyncio.create_task(ping_loop(websocket, interval, samples, stop))
+    await asyncio.sleep(duration)
+    stop.set()
+    await task
+    return samples
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    auth = await loop.run_in_executor(None, login, args.url, args.username, args.password)
+    if "access_token" not in auth:
+        raise SystemExit(f"Đăng nhập thất bại: {auth}")
+
+    async with websockets.connect(ws_url(args.url, auth["access_token"])) as websocket:
+        baseline = await measure(websocket, args.ping_interval, args.baseline_seconds)
+
+        samples = []
+        stop = asyncio.Event()
+        pinger = asyncio.create_task(ping_loop(websocket, args.ping_interval, samples, stop))
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        failures = 0
+
+        async def one_login():
+            nonlocal failures
+            async with semaphore:
+                result = await loop.run_in_executor(None, login, args.url, args.username, args.password)
+                if "access_token" not in result:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_login() for _ in range(args.logins)))
+        burst_seconds = time.perf_counter() - started
+        stop.set()
+        await pinger
+
+    return {
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "login_failures": failures,
+        "burst_seconds": burst_seconds,
+        "logins_per_second": args.logins / burst_seconds if burst_seconds else None,
+        "ping_baseline": summarize(baseline),
+        "ping_during_burst": summarize(samples),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--ping-interval", type=float, default=0.02)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # Cần đủ thread để gửi request đăng nhập song song
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency + 4))
+    result = loop.run_until_complete(run(args))
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Đo thông lượng gửi tin nhắn và độ trễ xác nhận (ack) qua WebSocket.
+
+Thời gian ack là từ lúc gửi message:send tới lúc người gửi nhận lại message:new cùng clientId,
+tức là sau khi tin nhắn đã được ghi vào database.
+
+So sánh ghi từng tin với ghi theo lô bằng cách chạy server 2 lần:
+
+    MESSAGE_INGEST_BATCH_MS=0 uvicorn main:app
+    python benchmarks/message_ingest.py --username admin --password 123456 --output single.json
+
+    MESSAGE_INGEST_BATCH_MS=5 uvicorn main:app
+    python benchmarks/message_ingest.py --username admin --password 123456 --baseline single.json
+
+Mặc định gửi vào hội thoại "Cloud của tôi", dùng --conversation-id để gửi vào một nhóm lớn.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import websockets
+
+from common import login, request_json, summarize, ws_url
+
+async def sender(websocket, conversation_id, count, in_flight, samples):
+    pending = {}
+    window = asyncio.Semaphore(in_flight)
+    done = asyncio.Event()
+    remaining = count
+
+    async def reader():
+        nonlocal remaining
+        async for raw in websocket:
+            message = json.loads(raw)
+            if message.get("event") != "message:new":
+                continue
+            started = pending.pop(message["payload"].get("clientId"), None)
+            if started is None:
+                continue
+            samples.append((time.perf_counter() - started) * 1000)
+            window.release()
+            remaining -= 1
+            if remaining == 0:
+                done.set()
+                return
+
+    reader_task = asyncio.create_task(reader())
+    prefix = uuid.uuid4().hex
+    for i in range(count):
+        await window.acquire()
+        client_id = f"{prefix}-{i}"
+        pending[client_id] = time.perf_counter()
+        await websocket.send(json.dumps({
+            "event": "message:send",
+            "data": {
+                "conversationId": conversation_id,
+                "content": f"benchmark {i}",
+                "type": "text",
+                "clientId": client_id,
+            },
+        }))
+    if count:
+        await done.wait()
+    reader_task.cancel()
+
+async def run(args):
+    loop = asyncio.get_running_loop()
+    auth = await loop.run_in_executor(None, login, args.url, args.username, args.password)
+    if "access_token" not in auth:
+        raise SystemExit(f"Đăng nhập thất bại: {auth}")
+    token = auth["access_token"]
+
+    conversation_id = args.conversation_id
+    if not conversation_id:
+        result = await loop.run_in_executor(None, request_json, f"{args.url}/api/conversations?limit=100", "GET", None, token)
+        conversation_id = next(
+            (c["_id"] for c in result.get("conversations", []) if c.get("type") == "self"), None
+        )
+        if not conversation_id:
+            raise SystemExit("Không tìm thấy hội thoại để gửi tin, hãy truyền --conversation-id")
+
+    sockets = [await websockets.connect(ws_url(args.url, token), max_queue=None) for _ in range(args.connections)]
+    per_socket = [args.messages // args.connections] * args.connections
+    per_socket[0] += args.messages % args.connections
+
+    samples = []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        sender(ws, conversation_id, count, args.in_flight, samples)
+        for ws, count in zip(sockets, per_socket)
+    ))
+    elapsed = time.perf_counter() - started
+
+    for ws in sockets:
+        await ws.close()
+
+    return {
+        "label": args.label,
+        "messages": args.messages,
+        "connections": args.connections,
+        "in_flight": args.in_flight,
+        "seconds": elapsed,
+        "messages_per_second": args.messages / elapsed if elapsed else None,
+        "ack": summarize(samples),
+    }
+
+def compare(result, baseline):
+    """Tỉ lệ so với lần chạy trước (>1 là nhanh hơn với thông lượng, <1 là tốt hơn với độ trễ)"""
+    def ratio(a, b):
+        return a / b if a is not None and b else None
+    return {
+        "baseline_label": baseline.get("label"),
+        "throughput_ratio": ratio(result["messages_per_second"], baseline.get("messages_per_second")),
+        "ack_p99_ratio": ratio(result["ack"]["p99_ms"], baseline.get("ack", {}).get("p99_ms")),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--conversation-id")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=20)
+    parser.add_argument("--in-flight", type=int, default=10, help="Số tin chưa được ack tối đa trên mỗi kết nối")
+    parser.add_argument("--label", default="", help="Nhãn ghi vào kết quả, vd. single hoặc batch-5ms")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File kết quả của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
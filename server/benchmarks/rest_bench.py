@@ -0,0 +1,157 @@
+"""Đo độ trễ và số lượt truy vấn MongoDB của từng REST endpoint trên bộ dữ liệu lớn.
+
+Dùng file mẫu do benchmarks/dataset.py tạo (token của các user đại diện: nhiều bạn bè nhất,
+thành viên nhóm lớn nhất, ngẫu nhiên). Server phải chạy với MONGODB_DB_NAME của bộ dữ liệu đó.
+
+    python benchmarks/rest_bench.py --sample-file sample.json --output scale.json
+    python benchmarks/rest_bench.py --sample-file sample.json --baseline scale.json
+
+Nếu có quyền chạy serverStatus (--mongo-url, mặc định MONGODB_URL), số lượt truy vấn MongoDB
+trung bình mỗi request được tính từ chênh lệch opcounters trước/sau mỗi endpoint. Con số này gồm
+mọi thao tác trên server MongoDB nên chỉ chính xác khi không có tải nào khác.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from common import request_json, summarize
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tên endpoint -> hàm tạo đường dẫn từ 1 user mẫu (None nếu user không dùng được cho endpoint này)
+ROUTES = {
+    "conversations": lambda u: "/api/conversations?limit=50",
+    "friends": lambda u: "/api/friends?limit=100",
+    "messages": lambda u: f"/api/conversations/{u['conversation_id']}/messages?limit=50" if u.get("conversation_id") else None,
+    "search_users": lambda u: "/api/users/search?q=" + urllib.parse.quote(u["search_prefix"]),
+    "search_messages": lambda u: "/api/search/messages?q=" + urllib.parse.quote(u["search_term"]),
+}
+
+OPCOUNTERS = ("query", "getmore", "insert", "update", "delete", "command")
+
+class MongoOps:
+    """Đọc tổng opcounters của MongoDB, None nếu không kết nối được"""
+
+    def __init__(self, url):
+        self.db = None
+        if not url:
+            return
+        try:
+            from pymongo import MongoClient
+            client = MongoClient(url, serverSelectionTimeoutMS=2000)
+            client.admin.command("ping")
+            self.db = client.admin
+        except Exception as e:
+            print(f"Không đo được số lượt truy vấn MongoDB: {e}", file=sys.stderr)
+
+    def total(self):
+        if self.db is None:
+            return None
+        counters = self.db.command("serverStatus")["opcounters"]
+        return sum(counters.get(name, 0) for name in OPCOUNTERS)
+
+def call(url, path, token):
+    started = time.perf_counter()
+    result = request_json(url + path, token=token)
+    return (time.perf_counter() - started) * 1000, "error" not in result
+
+def bench_route(args, name, users, mongo):
+    paths = [(path, u["token"]) for u in users if (path := ROUTES[name](u))]
+    if not paths:
+        return {"skipped": "Không có user mẫu phù hợp"}
+    jobs = [paths[i % len(paths)] for i in range(args.requests)]
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # Làm nóng cache như khi chạy thật
+        list(pool.map(lambda job: call(args.url, *job), jobs[:args.warmup]))
+
+        ops_before = mongo.total()
+        started = time.perf_counter()
+        results = list(pool.map(lambda job: call(args.url, *job), jobs))
+        elapsed = time.perf_counter() - started
+        ops_after = mongo.total()
+
+    samples = [ms for ms, ok in results if ok]
+    route = {
+        "requests": len(results),
+        "errors": len(results) - len(samples),
+        "requests_per_second": len(results) / elapsed if elapsed else None,
+        "latency": summarize(samples),
+    }
+    if ops_before is not None:
+        # Trừ lệnh serverStatus của lần đọc thứ hai
+        route["mongo_ops_per_request"] = max(0, ops_after - ops_before - 1) / len(results)
+    return route
+
+def compare(result, baseline):
+    """Tỉ lệ so với lần chạy trước theo từng endpoint (<1 là tốt hơn)"""
+    comparison = {}
+    for name, route in result["routes"].items():
+        old = baseline.get("routes", {}).get(name)
+        if not old or "latency" not in route or "latency" not in old:
+            continue
+        p99, old_p99 = route["latency"]["p99_ms"], old["latency"]["p99_ms"]
+        ops, old_ops = route.get("mongo_ops_per_request"), old.get("mongo_ops_per_request")
+        comparison[name] = {
+            "p99_ratio": p99 / old_p99 if p99 is not None and old_p99 else None,
+            "mongo_ops_ratio": ops / old_ops if ops is not None and old_ops else None,
+        }
+    return {"baseline_label": baseline.get("label"), "routes": comparison}
+
+def default_mongo_url():
+    sys.path.insert(0, SERVER_DIR)
+    cwd = os.getcwd()
+    os.chdir(SERVER_DIR)
+    try:
+        from app.config import get_settings
+        return get_settings().MONGODB_URL
+    finally:
+        os.chdir(cwd)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--sample-file", required=True)
+    parser.add_argument("--routes", default=",".join(ROUTES), help="Danh sách endpoint cần đo, cách nhau bởi dấu phẩy")
+    parser.add_argument("--requests", type=int, default=500, help="Số request mỗi endpoint")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mongo-url", default=None, help="Mặc định MONGODB_URL trong .env, truyền '' để tắt")
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File kết quả của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    with open(args.sample_file, encoding="utf-8") as f:
+        sample = json.load(f)
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown:
+        raise SystemExit(f"Endpoint không hỗ trợ: {', '.join(sorted(unknown))}")
+
+    mongo = MongoOps(default_mongo_url() if args.mongo_url is None else args.mongo_url)
+    result = {
+        "label": args.label,
+        "db_name": sample.get("db_name"),
+        "sample_users": len(sample["users"]),
+        "concurrency": args.concurrency,
+        "routes": {},
+    }
+    for name in routes:
+        print(f"Đang đo {name}...", file=sys.stderr)
+        result["routes"][name] = bench_route(args, name, sample["users"], mongo)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
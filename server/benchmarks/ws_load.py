@@ -0,0 +1,336 @@
+"""Tạo tải WebSocket với nhiều client đã xác thực và đo fan-out.
+
+Mặc định tự chạy benchmarks/bench_server.py (MongoDB tại MONGODB_URL, database alo_chat_bench)
+rồi mở --clients kết nối /ws. Mỗi client gửi ngẫu nhiên message:send, user:typing,
+message:read_all và ping vào nhóm chat của mình theo tỉ lệ --mix với tốc độ --rate sự kiện/giây.
+
+    python benchmarks/ws_load.py --users 2000 --clients 2000 --duration 30 --output run.json
+    python benchmarks/ws_load.py --in-memory --users 500 --clients 500
+    python benchmarks/ws_load.py --url http://localhost:8765 --tokens /tmp/bench_tokens.json
+
+Kết quả (JSON): số sự kiện đã gửi, số tin nhắn nhận được mỗi giây, độ trễ p50/p95/p99 từ lúc gửi
+tới lúc từng thành viên nhận message:new, độ trễ ping, CPU và RSS của process server.
+Truyền --baseline <file kết quả cũ> để so sánh giữa các lần chạy.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+from common import summarize, ws_url
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTENT_PREFIX = "bench:"
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+class ProcessSampler:
+    """Lấy mẫu CPU (% của 1 core) và RSS của process server mỗi giây (bỏ qua nếu server ở máy khác)"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.cpu = []
+        self.rss_mb = []
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def _read(self):
+        if psutil is not None:
+            process = psutil.Process(self.pid)
+            times = process.cpu_times()
+            return times.user + times.system, process.memory_info().rss
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / self._ticks
+        with open(f"/proc/{self.pid}/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        return cpu_seconds, rss
+
+    async def run(self, stop):
+        try:
+            last_cpu, _ = self._read()
+        except Exception:
+            return
+        last_at = time.perf_counter()
+        while not stop.is_set():
+            await asyncio.sleep(1)
+            try:
+                cpu, rss = self._read()
+            except Exception:
+                return
+            now = time.perf_counter()
+            self.cpu.append((cpu - last_cpu) / (now - last_at) * 100)
+            self.rss_mb.append(rss / 1024 / 1024)
+            last_cpu, last_at = cpu, now
+
+    def reset(self):
+        self.cpu.clear()
+        self.rss_mb.clear()
+
+    def summary(self):
+        if not self.cpu:
+            return None
+        return {
+            "pid": self.pid,
+            "cpu_percent_avg": sum(self.cpu) / len(self.cpu),
+            "cpu_percent_max": max(self.cpu),
+            "rss_mb_avg": sum(self.rss_mb) / len(self.rss_mb),
+            "rss_mb_max": max(self.rss_mb),
+        }
+
+class Stats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sent = {}
+        self.deliveries = 0
+        self.delivery_ms = []
+        self.ping_ms = []
+        self.disconnects = 0
+        self.started = time.perf_counter()
+
+class Client:
+    def __init__(self, user, conversation_id, stats):
+        self.user = user
+        self.conversation_id = conversation_id
+        self.stats = stats
+        self.websocket = None
+        self.ping_sent = None
+
+    async def connect(self, url):
+        self.websocket = await websockets.connect(ws_url(url, self.user["token"]), max_queue=None, ping_interval=None)
+
+    async def read(self):
+        try:
+            async for raw in self.websocket:
+                received = time.perf_counter()
+                message = json.loads(raw)
+                event = message.get("event")
+                if event == "message:new":
+                    content = message["payload"].get("content") or ""
+                    if content.startswith(CONTENT_PREFIX):
+                        self.stats.deliveries += 1
+                        self.stats.delivery_ms.append((received - float(content[len(CONTENT_PREFIX):])) * 1000)
+                elif event == "pong" and self.ping_sent is not None:
+                    self.stats.ping_ms.append((received - self.ping_sent) * 1000)
+                    self.ping_sent = None
+        except websockets.ConnectionClosed:
+            self.stats.disconnects += 1
+
+    async def drive(self, rate, events, weights, stop):
+        while not stop.is_set():
+            await asyncio.sleep(random.expovariate(rate))
+            event = random.choices(events, weights)[0]
+            if event == "send":
+                frame = {"event": "message:send", "data": {
+                    "conversationId": self.conversation_id,
+                    "content": f"{CONTENT_PREFIX}{time.perf_counter()}",
+                    "type": "text",
+                }}
+            elif event == "typing":
+                frame = {"event": "user:typing", "data": {"conversationId": self.conversation_id}}
+            elif event == "read_all":
+                frame = {"event": "message:read_all", "data": {"conversationId": self.conversation_id}}
+            else:
+                if self.ping_sent is not None:
+                    continue
+                self.ping_sent = time.perf_counter()
+                frame = {"event": "ping", "data": {}}
+            try:
+                await self.websocket.send(json.dumps(frame))
+            except websockets.ConnectionClosed:
+                return
+            self.stats.sent[event] = self.stats.sent.get(event, 0) + 1
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for_server(url, tokens_file, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit("Server benchmark đã dừng, xem log ở trên")
+        if os.path.exists(tokens_file):
+            try:
+                with urllib.request.urlopen(f"{url}/health", timeout=2):
+                    return
+            except OSError:
+                pass
+        time.sleep(0.5)
+    raise SystemExit("Hết thời gian chờ server benchmark khởi động")
+
+def start_server(args, tokens_file):
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "bench_server.py"),
+        "--port", str(port),
+        "--users", str(args.users),
+        "--group-size", str(args.group_size),
+        "--friends", str(args.friends),
+        "--tokens-file", tokens_file,
+    ]
+    if args.in_memory:
+        command.append("--in-memory")
+    return f"http://127.0.0.1:{port}", subprocess.Popen(command)
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - {"send", "typing", "read_all", "ping"}
+    if unknown:
+        raise SystemExit(f"Sự kiện không hỗ trợ trong --mix: {', '.join(sorted(unknown))}")
+    return list(weights), list(weights.values())
+
+async def run(args, url, fixtures):
+    group_of = {}
+    for group in fixtures["groups"]:
+        for user_id in group["members"]:
+            group_of[user_id] = group["id"]
+
+    stats = Stats()
+    users = fixtures["users"][:args.clients]
+    clients = [Client(user, group_of[user["id"]], stats) for user in users]
+
+    # Mở kết nối có giới hạn song song để không làm nghẽn lúc bắt tay
+    semaphore = asyncio.Semaphore(args.connect_concurrency)
+    connect_failures = 0
+
+    async def connect(client):
+        nonlocal connect_failures
+        async with semaphore:
+            try:
+                await client.connect(url)
+            except Exception:
+                connect_failures += 1
+
+    connect_started = time.perf_counter()
+    await asyncio.gather(*(connect(c) for c in clients))
+    connect_seconds = time.perf_counter() - connect_started
+    clients = [c for c in clients if c.websocket is not None]
+
+    sampler = ProcessSampler(fixtures["server_pid"]) if fixtures.get("server_pid") else None
+    stop = asyncio.Event()
+    events, weights = parse_mix(args.mix)
+    tasks = [asyncio.create_task(c.read()) for c in clients]
+    tasks += [asyncio.create_task(c.drive(args.rate, events, weights, stop)) for c in clients]
+    sampler_task = asyncio.create_task(sampler.run(stop)) if sampler else None
+
+    await asyncio.sleep(args.warmup)
+    stats.reset()
+    if sampler:
+        sampler.reset()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - stats.started
+
+    # Chờ các tin nhắn đang trên đường tới
+    await asyncio.sleep(args.drain)
+    for client in clients:
+        await client.websocket.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if sampler_task:
+        await sampler_task
+
+    sent_messages = stats.sent.get("send", 0)
+    return {
+        "config": {
+            "clients": len(clients),
+            "users": len(fixtures["users"]),
+            "groups": len(fixtures["groups"]),
+            "rate_per_client": args.rate,
+            "mix": args.mix,
+            "duration": args.duration,
+            "in_memory": args.in_memory,
+        },
+        "label": args.label,
+        "connect_seconds": connect_seconds,
+        "connect_failures": connect_failures,
+        "disconnects": stats.disconnects,
+        "sent": stats.sent,
+        "messages_sent_per_second": sent_messages / elapsed,
+        "deliveries": stats.deliveries,
+        "deliveries_per_second": stats.deliveries / elapsed,
+        "delivery_latency": summarize(stats.delivery_ms),
+        "ping_latency": summarize(stats.ping_ms),
+        "server": sampler.summary() if sampler else None,
+    }
+
+def compare(result, baseline):
+    """Tỉ lệ so với lần chạy trước (>1 là tốt hơn với thông lượng, <1 là tốt hơn với độ trễ)"""
+    def ratio(a, b):
+        return a / b if a is not None and b else None
+    return {
+        "baseline_label": baseline.get("label"),
+        "deliveries_per_second_ratio": ratio(result["deliveries_per_second"], baseline.get("deliveries_per_second")),
+        "delivery_p99_ratio": ratio(result["delivery_latency"]["p99_ms"], baseline.get("delivery_latency", {}).get("p99_ms")),
+        "ping_p99_ratio": ratio(result["ping_latency"]["p99_ms"], baseline.get("ping_latency", {}).get("p99_ms")),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Dùng server benchmark đang chạy (cần --tokens)")
+    parser.add_argument("--tokens", help="File token do bench_server.py tạo")
+    parser.add_argument("--in-memory", action="store_true", help="Server tự chạy dùng mongomock-motor thay MongoDB")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument("--friends", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="Số sự kiện/giây của mỗi client")
+    parser.add_argument("--mix", default="send=2,typing=5,read_all=1,ping=2")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--drain", type=float, default=2.0)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file")
+    parser.add_argument("--baseline", help="File kết quả của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    process = None
+    if args.url:
+        if not args.tokens:
+            raise SystemExit("Cần --tokens khi dùng --url")
+        url, tokens_file = args.url, args.tokens
+    else:
+        tokens_file = os.path.join(tempfile.mkdtemp(prefix="alo-bench-"), "tokens.json")
+        url, process = start_server(args, tokens_file)
+
+    try:
+        wait_for_server(url, tokens_file, process, args.startup_timeout)
+        with open(tokens_file, encoding="utf-8") as f:
+            fixtures = json.load(f)
+        result = asyncio.run(run(args, url, fixtures))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            result["compare"] = compare(result, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
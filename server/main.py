@@ -1,25 +1,62 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Depends, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from bson import ObjectId
 import json
 import asyncio
+import hmac
 import os
+import time
 
 from app.config import get_settings
 from app.database import connect_to_mongo, close_mongo_connection, get_database
-from app.routes import auth_router, conversations_router, users_router, friends_router, files_router
-from app.websocket import manager
-from app.services import decode_access_token
+from app.routes import auth_router, conversations_router, users_router, friends_router, files_router, uploads_router, search_router
+from app.websocket import manager, encode_frame
+from app.services import decode_access_token, get_current_admin, get_password_stats
+from app.services.read_state import advance_read_cursor, mark_conversation_read
+from app.services.membership import get_conversation_members
+from app.services.user_cache import get_user_profile
+from app.services.blob_store import release_blob, retain_blob, run_blob_gc
+from app.services.storage import UploadLimitMiddleware
+from app.routes.files import MAX_FILE_SIZE
+from app.routes.users import MAX_AVATAR_SIZE
+from app.services import thumbnails
+from app.services.thumbnails import image_payload, wait_for_image
+from app.services.text_search import message_search_text
+from app.services.presence import presence
+from app.services.conversation_summary import message_preview, record_new_message
+from app.services.message_ingest import message_ingest
+from app.services.cache import get_caches
+from app import db_trace
+from app.loop_monitor import loop_monitor
+from app.metrics import Gauge, MetricsMiddleware, WS_EVENT_ERRORS, WS_EVENT_SECONDS, render_metrics
 
 settings = get_settings()
 
+PONG_FRAME = encode_frame({"event": "pong"})
+
+# Sự kiện lạ từ client được gộp chung 1 nhãn để không làm phình số chuỗi chỉ số
+WS_EVENTS = {"ping", "message:send", "message:read", "message:read_all", "user:typing"}
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await connect_to_mongo()
+    await manager.start()
+    presence.start()
+    loop_monitor.start()
+    blob_gc = None
+    if settings.BLOB_GC_INTERVAL > 0:
+        blob_gc = asyncio.create_task(run_blob_gc(get_database(), settings.BLOB_GC_INTERVAL))
     yield
+    if blob_gc:
+        blob_gc.cancel()
+    await loop_monitor.stop()
+    await presence.stop()
+    await message_ingest.drain(get_database())
+    await manager.stop()
+    thumbnails.shutdown()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -28,6 +65,17 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if db_trace.is_enabled():
+    app.add_middleware(db_trace.DbTraceMiddleware)
+
+# Chặn file quá lớn trước khi form multipart được đọc vào file tạm
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/api/files/upload": MAX_FILE_SIZE,
+    "/api/users/avatar": MAX_AVATAR_SIZE,
+})
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -39,7 +87,7 @@ app.add_middleware(
 
 if not os.path.exists("uploads"):
     os.makedirs("uploads")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.include_router(uploads_router)
 
 # Routes
 app.include_router(auth_router, prefix="/api")
@@ -47,6 +95,7 @@ app.include_router(conversations_router, prefix="/api")
 app.include_router(users_router, prefix="/api")
 app.include_router(friends_router, prefix="/api")
 app.include_router(files_router, prefix="/api")
+app.include_router(search_router, prefix="/api")
 
 @app.get("/")
 async def root():
@@ -56,6 +105,44 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+def _queue_stats():
+    total, longest, dropped = manager.queue_stats()
+    return {("total",): total, ("max",): longest, ("dropped",): dropped}
+
+Gauge("alo_ws_connections", "Số kết nối WebSocket trên worker này",
+      callback=lambda: sum(len(connections) for connections in manager.active_connections.values()))
+Gauge("alo_ws_users", "Số user đang kết nối tới worker này", callback=lambda: len(manager.active_connections))
+Gauge("alo_ws_send_queue_frames", "Hàng đợi gửi của các kết nối: tổng, dài nhất, số frame đã bỏ",
+      ["stat"], callback=_queue_stats)
+Gauge("alo_background_tasks", "Số việc nền đang chờ", ["kind"], callback=lambda: {
+    ("asyncio",): len(asyncio.all_tasks()),
+    ("presence",): presence.pending,
+    ("message_ingest",): message_ingest.pending,
+    ("thumbnails",): thumbnails.pending_count(),
+})
+Gauge("alo_password_hash", "Pool băm/kiểm tra mật khẩu: số worker, đang chờ, đang chạy, đã xong, bị từ chối",
+      ["stat"], callback=lambda: {(stat,): value for stat, value in get_password_stats().items()})
+Gauge("alo_cache", "Thống kê cache của worker này (kích thước, trúng/trượt, thời gian tải và thời gian tiết kiệm được)", ["cache", "stat"], callback=lambda: {
+    (name, stat): value
+    for name, cache in get_caches().items()
+    for stat, value in cache.stats().items()
+    if stat != "name"
+})
+
+if settings.METRICS_ENABLED and settings.METRICS_TOKEN:
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(authorization: str = Header("")):
+        # Token riêng cho Prometheus thay vì JWT của user (hết hạn theo phiên đăng nhập)
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=401, detail="Token không hợp lệ", headers={"WWW-Authenticate": "Bearer"})
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+if loop_monitor.enabled:
+    # Stack trace chứa đường dẫn mã nguồn trên server, chỉ quản trị viên được xem
+    @app.get("/diagnostics/loop", include_in_schema=False, dependencies=[Depends(get_current_admin)])
+    async def loop_diagnostics():
+        return loop_monitor.stats()
+
 # WebSocket endpoint
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
@@ -70,28 +157,26 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
         await websocket.close(code=4001)
         return
     
-    await manager.connect(websocket, user_id)
+    connection, connections = await manager.connect(websocket, user_id)
     db = get_database()
     
-    # Cập nhật trạng thái online
-    await db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"status": "online", "last_online": datetime.now(timezone.utc)}}
-    )
-    
-    # Thông báo cho bạn bè rằng user này đã online
-    await notify_friends_status(db, user_id, "online")
+    # Cập nhật trạng thái online và thông báo cho bạn bè (gộp theo lô)
+    presence.user_connected(user_id, connections)
     
     try:
         while True:
             data = await websocket.receive_json()
             event = data.get("event")
             payload = data.get("data", {})
+            started = time.perf_counter()
+            label = event if event in WS_EVENTS else "unknown"
             
             if event == "ping":
-                await websocket.send_json({"event": "pong"})
+                connection.enqueue(PONG_FRAME)
+                WS_EVENT_SECONDS.observe(time.perf_counter() - started, label)
                 continue
 
+            trace = db_trace.start_trace(f"ws {label}")
             try:
                 if event == "message:send":
                     await handle_message_send(user_id, payload, db)
@@ -102,45 +187,15 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
                 elif event == "user:typing":
                     await handle_typing(user_id, payload)
             except Exception:
-                pass
+                WS_EVENT_ERRORS.inc(label)
+            db_trace.finish_trace(trace)
+            WS_EVENT_SECONDS.observe(time.perf_counter() - started, label)
     
     except (WebSocketDisconnect, Exception):
-        manager.disconnect(websocket, user_id)
-
-        # Chỉ set offline nếu không còn kết nối nào khác
-        if not manager.is_user_online(user_id):
-            await db.users.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": {"status": "offline", "last_online": datetime.now(timezone.utc)}}
-            )
+        remaining = await manager.disconnect(websocket, user_id)
 
-            # Thông báo cho bạn bè rằng user này đã offline
-            await notify_friends_status(db, user_id, "offline")
-
-async def notify_friends_status(db, user_id: str, status: str):
-    cursor = db.friendships.find({
-        "status": "accepted",
-        "$or": [
-            {"from_user_id": user_id},
-            {"to_user_id": user_id}
-        ]
-    })
-    friendships = await cursor.to_list(100)
-    
-    friend_ids = []
-    for fs in friendships:
-        friend_id = fs["to_user_id"] if fs["from_user_id"] == user_id else fs["from_user_id"]
-        friend_ids.append(friend_id)
-    
-    if friend_ids:
-        payload = {"userId": user_id, "status": status}
-        if status == "offline":
-            payload["lastOnline"] = datetime.now(timezone.utc).isoformat()
-            
-        await manager.broadcast_to_users({
-            "event": "user:status",
-            "payload": payload
-        }, friend_ids)
+        # Chỉ set offline sau khoảng chờ nếu không còn kết nối nào khác (kể cả ở worker khác)
+        await presence.user_disconnected(user_id, remaining)
 
 async def handle_message_send(sender_id: str, payload: dict, db):
     conversation_id = payload.get("conversationId")
@@ -151,6 +206,10 @@ async def handle_message_send(sender_id: str, payload: dict, db):
     
     now = datetime.now(timezone.utc)
     
+    # Tin nhắn ảnh mang theo kích thước và các ảnh thu nhỏ nếu đã tạo xong, không chờ ảnh đang tạo
+    blob = await retain_blob(db, file_url)
+    image = image_payload(blob.get("image")) if blob else None
+    
     # Tạo tin nhắn
     message = {
         "conversation_id": conversation_id,
@@ -159,20 +218,31 @@ async def handle_message_send(sender_id: str, payload: dict, db):
         "type": msg_type,
         "file_url": file_url,
         "file_name": file_name,
+        "image": image,
+        "search_text": message_search_text(content, file_name),
         "status": [{"user_id": sender_id, "status": "sent", "at": now}],
         "created_at": now,
     }
     
-    result = await db.messages.insert_one(message)
+    try:
+        if message_ingest.enabled:
+            # Ghi theo lô, tin nhắn cuối và số tin chưa đọc được cập nhật cùng lô
+            message_id = await message_ingest.submit(db, message)
+        else:
+            message_id = (await db.messages.insert_one(message)).inserted_id
+    except Exception:
+        if blob:
+            await release_blob(db, file_url)
+        raise
     
     client_id = payload.get("clientId")
     
-    sender = await db.users.find_one({"_id": ObjectId(sender_id)})
+    sender = await get_user_profile(db, sender_id)
     sender_name = sender.get("display_name", "Người dùng") if sender else "Người dùng"
     sender_avatar = sender.get("avatar_url") if sender else None
 
     ws_message = {
-        "_id": str(result.inserted_id),
+        "_id": str(message_id),
         "clientId": client_id,
         "conversation_id": conversation_id,
         "sender_id": sender_id,
@@ -182,33 +252,47 @@ async def handle_message_send(sender_id: str, payload: dict, db):
         "type": msg_type,
         "file_url": file_url,
         "file_name": file_name,
+        "image": image,
         "status": [{"user_id": sender_id, "status": "sent", "at": now.isoformat()}],
         "created_at": now.isoformat(),
     }
 
-    await manager.send_personal_message({
+    # Mã hóa 1 lần cho cả người gửi và các thành viên khác
+    frame = encode_frame({
         "event": "message:new",
         "payload": ws_message
-    }, sender_id)
+    })
+    await manager.send_personal_message(frame, sender_id)
+    
+    preview = message_preview(str(message_id), message)
     
     async def background_tasks():
-        await db.conversations.update_one(
-            {"_id": ObjectId(conversation_id)},
-            {"$set": {"last_message_at": now}}
-        )
-        
-        conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-        if not conversation:
+        members = await get_conversation_members(db, conversation_id)
+        if not members:
             return
             
-        member_ids = [m["user_id"] for m in conversation["members"]]
-        other_member_ids = [uid for uid in member_ids if uid != sender_id]
+        other_member_ids = [uid for uid in members if uid != sender_id]
         
         if other_member_ids:
-            await manager.broadcast_to_users({
-                "event": "message:new",
-                "payload": ws_message
-            }, other_member_ids)
+            await manager.broadcast_to_users(frame, other_member_ids)
+        
+        # Tin nhắn cuối và số tin chưa đọc được cập nhật sau khi đã gửi đi, lỗi ghi không chặn việc gửi
+        if not message_ingest.enabled:
+            await record_new_message(db, conversation_id, preview)
+
+        # Ảnh thu nhỏ tạo xong sau khi gửi: lưu vào tin nhắn và gửi bổ sung cho mọi thành viên
+        if blob and image is None:
+            image_info = await wait_for_image(db, blob["_id"])
+            if image_info:
+                await db.messages.update_one({"_id": message_id}, {"$set": {"image": image_info}})
+                await manager.broadcast_to_users({
+                    "event": "message:image",
+                    "payload": {
+                        "messageId": str(message_id),
+                        "conversationId": conversation_id,
+                        "image": image_info,
+                    }
+                }, members)
 
     asyncio.create_task(background_tasks())
 
@@ -216,19 +300,13 @@ async def handle_conversation_read(user_id: str, payload: dict, db):
     conversation_id = payload.get("conversationId")
     if not conversation_id:
         return
-        
-    await db.messages.update_many(
-        {
-            "conversation_id": conversation_id,
-            "sender_id": {"$ne": user_id},
-            "status.user_id": {"$ne": user_id}
-        },
-        {"$push": {"status": {"user_id": user_id, "status": "read", "at": datetime.now(timezone.utc)}}}
-    )
     
-    conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-    if conversation:
-        member_ids = [m["user_id"] for m in conversation["members"] if m["user_id"] != user_id]
+    # Chỉ dời mốc đã đọc của thành viên, không ghi lại từng tin nhắn
+    await mark_conversation_read(db, conversation_id, user_id)
+    
+    members = await get_conversation_members(db, conversation_id)
+    if members:
+        member_ids = [uid for uid in members if uid != user_id]
         if member_ids:
             asyncio.create_task(manager.broadcast_to_users({
                 "event": "message:read_all",
@@ -242,14 +320,14 @@ async def handle_message_read(user_id: str, payload: dict, db):
     conversation_id = payload.get("conversationId")
     message_id = payload.get("messageId")
     
-    await db.messages.update_one(
+    message = await db.messages.find_one(
         {"_id": ObjectId(message_id)},
-        {"$push": {"status": {"user_id": user_id, "status": "read", "at": datetime.now(timezone.utc)}}}
+        {"conversation_id": 1, "sender_id": 1, "created_at": 1}
     )
-    
-    # Thông báo cho người gửi
-    message = await db.messages.find_one({"_id": ObjectId(message_id)})
     if message:
+        await advance_read_cursor(db, message["conversation_id"], user_id, message_id, message["created_at"])
+        
+        # Thông báo cho người gửi
         await manager.send_personal_message({
             "event": "message:status",
             "payload": {
@@ -264,12 +342,12 @@ async def handle_typing(user_id: str, payload: dict):
     conversation_id = payload.get("conversationId")
     db = get_database()
     
-    conversation = await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-    if conversation:
-        user = await db.users.find_one({"_id": ObjectId(user_id)})
+    members = await get_conversation_members(db, conversation_id)
+    if members:
+        user = await get_user_profile(db, user_id)
         user_name = user.get("display_name", user.get("username", "Người dùng")) if user else "Người dùng"
         
-        member_ids = [m["user_id"] for m in conversation["members"] if m["user_id"] != user_id]
+        member_ids = [uid for uid in members if uid != user_id]
         asyncio.create_task(manager.broadcast_to_users({
             "event": "user:typing",
             "payload": {"conversationId": conversation_id, "userId": user_id, "userName": user_name}
@@ -0,0 +1,7 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+@pytest.fixture
+def db():
+    """Database MongoDB giả lập trong process (mongomock)"""
+    return AsyncMongoMockClient(tz_aware=True)["alo_chat_test"]
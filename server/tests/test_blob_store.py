@@ -0,0 +1,66 @@
+"""Kiểm tra dọn rác blob lưu theo nội dung."""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockCollection
+
+from app.services.blob_store import BLOB_DIR, collect_garbage, derivative_name
+
+BLOB_ID = "a" * 64 + ".png"
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(BLOB_DIR)
+
+def write_file(name: str):
+    with open(os.path.join(BLOB_DIR, name), "wb") as f:
+        f.write(b"data")
+
+async def insert_unreferenced_blob(db):
+    await db.blobs.insert_one({
+        "_id": BLOB_ID,
+        "refcount": 0,
+        "last_uploaded_at": datetime.now(timezone.utc) - timedelta(days=1),
+    })
+    write_file(BLOB_ID)
+    write_file(derivative_name(BLOB_ID, 240))
+
+def test_removes_unreferenced_blob_and_derivatives(db):
+    async def scenario():
+        await insert_unreferenced_blob(db)
+        await collect_garbage(db, [BLOB_ID])
+        assert await db.blobs.find_one({"_id": BLOB_ID}) is None
+        assert os.listdir(BLOB_DIR) == []
+
+    asyncio.run(scenario())
+
+def test_keeps_file_of_blob_uploaded_again_during_collection(db, monkeypatch):
+    delete_one = AsyncMongoMockCollection.delete_one
+
+    async def delete_then_reupload(self, *args, **kwargs):
+        result = await delete_one(self, *args, **kwargs)
+        # Cùng nội dung được upload lại ngay sau khi document bị xóa
+        await self.insert_one({"_id": BLOB_ID, "refcount": 0, "last_uploaded_at": datetime.now(timezone.utc)})
+        return result
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "delete_one", delete_then_reupload)
+
+    async def scenario():
+        await insert_unreferenced_blob(db)
+        await collect_garbage(db, [BLOB_ID])
+        assert await db.blobs.find_one({"_id": BLOB_ID}) is not None
+        assert os.path.exists(os.path.join(BLOB_DIR, BLOB_ID))
+
+    asyncio.run(scenario())
+
+def test_keeps_recently_uploaded_blob(db):
+    async def scenario():
+        await db.blobs.insert_one({"_id": BLOB_ID, "refcount": 0, "last_uploaded_at": datetime.now(timezone.utc)})
+        write_file(BLOB_ID)
+        await collect_garbage(db, [BLOB_ID])
+        assert os.path.exists(os.path.join(BLOB_DIR, BLOB_ID))
+
+    asyncio.run(scenario())
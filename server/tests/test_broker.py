@@ -0,0 +1,141 @@
+"""Kiểm tra RedisBroker trên Redis giả lập (fakeredis), mô phỏng nhiều worker dùng chung 1 server."""
+import asyncio
+
+import fakeredis
+import pytest
+from redis import asyncio as aioredis
+
+from app.websocket.broker import RedisBroker
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        aioredis, "from_url",
+        lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs)
+    )
+    return server
+
+class Worker:
+    """1 worker giả: RedisBroker kèm danh sách tin nhắn/thông báo nhận được"""
+
+    def __init__(self, presence_ttl: float = 30.0):
+        self.broker = RedisBroker("redis://fake", presence_ttl=presence_ttl)
+        self.messages = []
+        self.events = []
+
+    async def start(self):
+        async def on_message(user_id, data):
+            self.messages.append((user_id, data))
+
+        async def on_event(data):
+            self.events.append(data)
+
+        await self.broker.start(on_message, on_event)
+
+async def wait_until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("Hết thời gian chờ")
+        await asyncio.sleep(0.01)
+
+def test_publish_fans_out_to_subscribed_workers(redis_server):
+    async def scenario():
+        a, b, c = Worker(), Worker(), Worker()
+        for worker in (a, b, c):
+            await worker.start()
+        await b.broker.subscribe("u1")
+        await c.broker.subscribe("u2")
+        await a.broker.subscribe("u1")
+
+        await a.broker.publish(["u1", "u2", "u3"], '{"event":"x"}')
+        await a.broker.publish_event('{"topic":"cache:invalidate"}')
+        await wait_until(lambda: b.messages and c.messages and b.events and c.events)
+        await asyncio.sleep(0.05)
+
+        assert b.messages == [("u1", '{"event":"x"}')]
+        assert c.messages == [("u2", '{"event":"x"}')]
+        assert b.events == c.events == ['{"topic":"cache:invalidate"}']
+        # Worker không nhận lại tin nhắn do chính nó publish
+        assert a.messages == [] and a.events == []
+
+        await b.broker.unsubscribe("u1")
+        await a.broker.publish(["u1"], "again")
+        await asyncio.sleep(0.05)
+        assert b.messages == [("u1", '{"event":"x"}')]
+
+        for worker in (a, b, c):
+            await worker.broker.stop()
+
+    asyncio.run(scenario())
+
+def test_presence_is_counted_across_workers(redis_server):
+    async def scenario():
+        a, b = Worker(), Worker()
+        await a.start()
+        await b.start()
+
+        assert await a.broker.add_presence("u") == 1
+        assert await b.broker.add_presence("u") == 2
+        assert await a.broker.add_presence("u") == 3
+        assert await b.broker.presence_count("u") == 3
+        assert await a.broker.presence_count("other") == 0
+
+        assert await a.broker.remove_presence("u") == 2
+        assert await a.broker.remove_presence("u") == 1
+        assert await a.broker.is_online("u")
+        assert await b.broker.remove_presence("u") == 0
+        assert not await a.broker.is_online("u")
+
+        await a.broker.stop()
+        await b.broker.stop()
+
+    asyncio.run(scenario())
+
+def test_stopped_worker_presence_is_removed(redis_server):
+    async def scenario():
+        a, b = Worker(), Worker()
+        await a.start()
+        await b.start()
+        await a.broker.add_presence("u")
+        await a.broker.stop()
+        assert await b.broker.presence_count("u") == 0
+        await b.broker.stop()
+
+    asyncio.run(scenario())
+
+def test_crashed_worker_presence_expires(redis_server):
+    async def scenario():
+        crashed, alive = Worker(presence_ttl=0.3), Worker(presence_ttl=0.3)
+        await crashed.start()
+        await alive.start()
+        await crashed.broker.add_presence("u")
+        await alive.broker.add_presence("v")
+
+        # Worker bị kill: không gia hạn, không dọn dẹp
+        crashed.broker._heartbeat.cancel()
+        await asyncio.sleep(0.6)
+
+        assert await alive.broker.presence_count("u") == 0
+        # Worker còn sống vẫn được gia hạn
+        assert await alive.broker.presence_count("v") == 1
+        await alive.broker.stop()
+
+    asyncio.run(scenario())
+
+def test_heartbeat_restores_expired_presence(redis_server):
+    async def scenario():
+        worker = Worker()
+        await worker.start()
+        await worker.broker.add_presence("u")
+        await worker.broker.add_presence("u")
+
+        # Hash hết hạn khi worker vẫn sống (vd. Redis bị chặn lâu hơn hạn sống)
+        await worker.broker.redis.delete(worker.broker._presence_key(worker.broker.worker_id))
+        assert await worker.broker.presence_count("u") == 0
+        await worker.broker._refresh_presence()
+        assert await worker.broker.presence_count("u") == 2
+        await worker.broker.stop()
+
+    asyncio.run(scenario())
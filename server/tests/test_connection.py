@@ -0,0 +1,155 @@
+"""Kiểm tra hàng đợi gửi của ClientConnection: gộp frame, bỏ frame, ngắt client chậm."""
+import asyncio
+
+from app.websocket.connection import SLOW_CONSUMER_CLOSE_CODE, ClientConnection
+
+class FakeWebSocket:
+    """WebSocket giả: chỉ gửi được khi cổng mở, giả lập client nhận chậm"""
+
+    def __init__(self):
+        self.sent = []
+        self.close_code = None
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = False
+
+    async def send_text(self, frame: str):
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("socket đã đóng")
+        self.sent.append(frame)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+def make_connection(**options) -> ClientConnection:
+    evicted = []
+    settings = {"high_watermark": 4, "low_watermark": 1, "max_size": 8, "slow_timeout": 60.0}
+    settings.update(options)
+    connection = ClientConnection(FakeWebSocket(), "u1", on_evict=evicted.append, **settings)
+    connection.evicted = evicted
+    connection.start()
+    return connection
+
+async def stalled(connection: ClientConnection):
+    """Chặn client, frame đầu tiên bị giữ trong send_text và không còn tính trong hàng đợi"""
+    connection.websocket.gate.clear()
+    connection.enqueue("in-flight")
+    await asyncio.sleep(0)
+
+async def drain(connection: ClientConnection):
+    connection.websocket.gate.set()
+    for _ in range(100):
+        if not connection.queue_depth:
+            break
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+def test_frames_are_sent_in_order():
+    async def scenario():
+        connection = make_connection()
+        for i in range(3):
+            assert connection.enqueue(f"m{i}")
+        await drain(connection)
+        assert connection.websocket.sent == ["m0", "m1", "m2"]
+        connection.close()
+
+    asyncio.run(scenario())
+
+def test_pending_frames_with_same_key_are_coalesced_in_place():
+    async def scenario():
+        connection = make_connection()
+        await stalled(connection)
+        connection.enqueue("typing-1", coalesce_key="typing:c1:u2")
+        connection.enqueue("message")
+        connection.enqueue("typing-2", coalesce_key="typing:c1:u2")
+        assert connection.queue_depth == 2
+
+        await drain(connection)
+        assert connection.websocket.sent == ["in-flight", "typing-2", "message"]
+
+        # Frame đã gửi thì frame cùng key sau đó được xếp hàng bình thường
+        connection.enqueue("typing-3", coalesce_key="typing:c1:u2")
+        await drain(connection)
+        assert connection.websocket.sent[-1] == "typing-3"
+        connection.close()
+
+    asyncio.run(scenario())
+
+def test_droppable_frames_are_dropped_above_high_watermark():
+    async def scenario():
+        connection = make_connection()
+        await stalled(connection)
+        for i in range(4):
+            connection.enqueue(f"m{i}")
+        assert not connection.enqueue("typing", coalesce_key="typing:c1:u2", droppable=True)
+        assert connection.dropped == 1
+        # Frame không được bỏ vẫn vào hàng đợi tới khi chạm max_size
+        assert connection.enqueue("m4")
+        assert connection.queue_depth == 5 and not connection.closed
+        connection.close()
+
+    asyncio.run(scenario())
+
+def test_client_is_evicted_when_queue_reaches_max_size():
+    async def scenario():
+        connection = make_connection()
+        await stalled(connection)
+        for i in range(8):
+            assert connection.enqueue(f"m{i}")
+        assert not connection.enqueue("overflow")
+        await asyncio.sleep(0.01)
+
+        assert connection.closed
+        assert connection.evicted == [connection]
+        assert connection.websocket.close_code == SLOW_CONSUMER_CLOSE_CODE
+        assert connection.queue_depth == 0
+        assert not connection.enqueue("after")
+
+    asyncio.run(scenario())
+
+def test_client_is_evicted_after_staying_slow_too_long():
+    async def scenario():
+        connection = make_connection(slow_timeout=0.05)
+        await stalled(connection)
+        for i in range(4):
+            connection.enqueue(f"m{i}")
+        assert connection.enqueue("m4")
+        await asyncio.sleep(0.1)
+        assert not connection.enqueue("m5")
+        assert connection.evicted == [connection]
+
+    asyncio.run(scenario())
+
+def test_slow_state_resets_after_draining_below_low_watermark():
+    async def scenario():
+        connection = make_connection(slow_timeout=0.05)
+        await stalled(connection)
+        for i in range(5):
+            connection.enqueue(f"m{i}")
+        await drain(connection)
+
+        await asyncio.sleep(0.1)
+        # Nghẽn lại sau khi đã hồi phục: tính lại thời gian từ đầu, không bị ngắt ngay
+        await stalled(connection)
+        for i in range(5):
+            assert connection.enqueue(f"n{i}")
+        assert connection.evicted == []
+        connection.close()
+
+    asyncio.run(scenario())
+
+def test_send_failure_closes_connection():
+    async def scenario():
+        connection = make_connection()
+        connection.websocket.fail = True
+        connection.enqueue("m0")
+        await asyncio.sleep(0)
+        connection.enqueue("m1")
+        await asyncio.sleep(0)
+
+        assert connection.closed
+        assert connection.queue_depth == 0
+        assert not connection.enqueue("m2")
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+"""Kiểm tra phân trang danh sách hội thoại theo cursor (is_pinned, last_message_at, _id)."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.routes import conversations as conversations_module
+from app.routes.conversations import get_conversations
+
+USER = {"_id": "u1"}
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def inbox(db, monkeypatch):
+    monkeypatch.setattr(conversations_module, "get_database", lambda: db)
+
+    async def setup():
+        # Có hội thoại trùng last_message_at, chưa có tin nhắn, được ghim và của user khác
+        minutes = [5, 3, 3, 3, None, 1, None, 7, 3]
+        pinned = {1, 4, 7}
+        for i, minute in enumerate(minutes):
+            await db.conversations.insert_one({
+                "_id": ObjectId(),
+                "members": [{"user_id": "u1", "unread_count": i}, {"user_id": "u2"}],
+                "pinned_by": ["u1"] if i in pinned else ["u2"],
+                "last_message_at": BASE + timedelta(minutes=minute) if minute is not None else None,
+                "last_message": None,
+            })
+        await db.conversations.insert_one({
+            "_id": ObjectId(), "members": [{"user_id": "u2"}], "last_message_at": BASE, "last_message": None,
+        })
+        return await db.conversations.find({"members.user_id": "u1"}).to_list(None)
+
+    return asyncio.run(setup())
+
+def expected_order(conversations):
+    def key(conversation):
+        at = conversation["last_message_at"]
+        return (
+            "u1" in conversation["pinned_by"],
+            at is not None,
+            at or BASE,
+            conversation["_id"],
+        )
+    return [str(c["_id"]) for c in sorted(conversations, key=key, reverse=True)]
+
+async def walk(limit: int):
+    ids, cursor = [], None
+    while True:
+        page = await get_conversations(cursor=cursor, limit=limit, current_user=USER)
+        ids += [c["_id"] for c in page["conversations"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids, page
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 100])
+def test_pages_cover_inbox_once_in_order(inbox, limit):
+    ids, _ = asyncio.run(walk(limit))
+    assert ids == expected_order(inbox)
+
+def test_page_carries_pin_state_and_unread_count(inbox):
+    page = asyncio.run(get_conversations(cursor=None, limit=100, current_user=USER))
+    by_id = {str(c["_id"]): c for c in inbox}
+    for conversation in page["conversations"]:
+        source = by_id[conversation["_id"]]
+        assert conversation["is_pinned"] == ("u1" in source["pinned_by"])
+        assert conversation["unread_count"] == source["members"][0]["unread_count"]
+
+def test_rejects_malformed_cursor(inbox):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(get_conversations(cursor="bm90LWpzb24", limit=10, current_user=USER))
+    assert error.value.status_code == 400
@@ -0,0 +1,110 @@
+"""Kiểm tra ghi tin nhắn theo lô của MessageIngest, kể cả khi lô chỉ ghi được một phần."""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockCollection
+from pymongo.errors import BulkWriteError
+
+from app.services.message_ingest import MessageIngest
+
+def new_message(conversation_id: str = "c1", **fields) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "sender_id": "u1",
+        "type": "text",
+        "content": "xin chào",
+        "created_at": datetime.now(timezone.utc),
+        **fields,
+    }
+
+@pytest.fixture
+def ingest(monkeypatch):
+    ingest = MessageIngest(batch_ms=20, max_batch=3)
+    ingest.summarized = []
+
+    async def record_summaries(db, messages):
+        ingest.summarized.append([m["_id"] for m in messages])
+
+    monkeypatch.setattr(ingest, "_update_summaries", record_summaries)
+    return ingest
+
+@pytest.fixture
+def insert_calls(monkeypatch):
+    calls = []
+    insert_many = AsyncMongoMockCollection.insert_many
+
+    async def counting_insert_many(self, documents, *args, **kwargs):
+        calls.append(len(documents))
+        return await insert_many(self, documents, *args, **kwargs)
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "insert_many", counting_insert_many)
+    return calls
+
+def test_messages_within_window_are_written_in_one_batch(ingest, insert_calls, db):
+    async def scenario():
+        messages = [new_message(content=str(i)) for i in range(2)]
+        ids = await asyncio.gather(*(ingest.submit(db, m) for m in messages))
+
+        assert insert_calls == [2]
+        assert ids == [m["_id"] for m in messages]
+        stored = await db.messages.find().sort("_id", 1).to_list(None)
+        assert [m["content"] for m in stored] == ["0", "1"]
+        assert ingest.summarized == [ids]
+        assert ingest.pending == 0
+
+    asyncio.run(scenario())
+
+def test_full_batch_is_written_without_waiting(ingest, insert_calls, db):
+    async def scenario():
+        tasks = [asyncio.create_task(ingest.submit(db, new_message())) for _ in range(3)]
+        # Ngắn hơn nhiều so với batch_ms
+        done, _ = await asyncio.wait(tasks, timeout=0.005)
+        assert len(done) == 3
+        assert insert_calls == [3]
+
+    asyncio.run(scenario())
+
+def test_partial_bulk_write_error_acks_inserted_prefix_only(ingest, db):
+    async def scenario():
+        duplicate_id = ObjectId()
+        await db.messages.insert_one(new_message(_id=duplicate_id))
+        messages = [new_message(), new_message(_id=duplicate_id), new_message()]
+
+        results = await asyncio.gather(*(ingest.submit(db, m) for m in messages), return_exceptions=True)
+
+        # Ghi theo thứ tự: chỉ tin trước tin lỗi được lưu và được xác nhận
+        assert results[0] == messages[0]["_id"]
+        assert isinstance(results[1], BulkWriteError)
+        assert isinstance(results[2], BulkWriteError)
+        assert await db.messages.count_documents({}) == 2
+        assert ingest.summarized == [[messages[0]["_id"]]]
+
+    asyncio.run(scenario())
+
+def test_other_errors_fail_whole_batch(ingest, db, monkeypatch):
+    async def failing_insert_many(self, documents, *args, **kwargs):
+        raise ConnectionError("mất kết nối")
+
+    monkeypatch.setattr(AsyncMongoMockCollection, "insert_many", failing_insert_many)
+
+    async def scenario():
+        results = await asyncio.gather(*(ingest.submit(db, new_message()) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(r, ConnectionError) for r in results)
+        assert ingest.summarized == []
+
+    asyncio.run(scenario())
+
+def test_drain_writes_pending_messages(ingest, insert_calls, db):
+    async def scenario():
+        ingest.delay = 60
+        task = asyncio.create_task(ingest.submit(db, new_message()))
+        await asyncio.sleep(0)
+        assert ingest.pending == 1
+
+        await ingest.drain(db)
+        assert insert_calls == [1]
+        assert await task == (await db.messages.find_one())["_id"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+"""Kiểm tra phân trang lịch sử tin nhắn theo cursor (created_at, _id)."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from app.routes import conversations as conversations_module
+from app.routes.conversations import get_messages
+from app.services.pagination import encode_cursor
+
+USER = {"_id": "u1"}
+CONVERSATION_ID = str(ObjectId())
+BASE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+@pytest.fixture
+def history(db, monkeypatch):
+    async def members(db, conversation_id):
+        return {"u1": "member"} if conversation_id == CONVERSATION_ID else None
+
+    monkeypatch.setattr(conversations_module, "get_database", lambda: db)
+    monkeypatch.setattr(conversations_module, "get_conversation_members", members)
+
+    async def setup():
+        # Nhiều tin trùng created_at để cursor phải dựa vào _id
+        minutes = [0, 1, 1, 1, 2, 3, 3, 4, 5]
+        ids = []
+        for minute in minutes:
+            result = await db.messages.insert_one({
+                "conversation_id": CONVERSATION_ID,
+                "sender_id": "u2",
+                "content": f"m{minute}",
+                "created_at": BASE + timedelta(minutes=minute),
+                "status": [{"status": "sent"}, {"status": "read"}],
+                "search_text": "m",
+            })
+            ids.append(str(result.inserted_id))
+        await db.messages.insert_one({"conversation_id": "other", "created_at": BASE, "content": "x"})
+        return ids
+
+    return asyncio.run(setup())
+
+def fetch(**params):
+    return asyncio.run(get_messages(CONVERSATION_ID, current_user=USER, **{"limit": 50, **params}))
+
+def ids_of(page):
+    return [m["_id"] for m in page["messages"]]
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_walks_backwards_from_latest(history, limit):
+    page = fetch(limit=limit)
+    assert page["has_more_after"] is False
+    seen = ids_of(page)
+    while page["has_more_before"]:
+        page = fetch(limit=limit, before=page["before_cursor"])
+        assert page["has_more_after"] is True
+        seen = ids_of(page) + seen
+    assert seen == history
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_walks_forwards_from_oldest(history, limit):
+    first = fetch(limit=1, before=fetch(limit=len(history))["before_cursor"])
+    assert first["messages"] == [] and first["has_more_before"] is False
+
+    page = fetch(limit=limit, after=fetch(limit=len(history))["before_cursor"])
+    seen = [history[0]] + ids_of(page)
+    while page["has_more_after"]:
+        assert page["has_more_before"] is True
+        page = fetch(limit=limit, after=page["after_cursor"])
+        seen += ids_of(page)
+    assert seen == history
+
+def test_after_cursor_reports_older_messages(history):
+    latest = fetch(limit=1)
+    page = fetch(limit=3, after=latest["after_cursor"])
+    assert page["messages"] == []
+    assert page["has_more_before"] is True
+    assert page["has_more_after"] is False
+
+def test_after_cursor_before_first_message_has_nothing_older(history):
+    # Vd. cursor của tin nhắn đã bị xóa, đứng trước mọi tin còn lại
+    cursor = encode_cursor({"t": BASE - timedelta(minutes=1), "id": str(ObjectId())})
+    page = fetch(limit=3, after=cursor)
+    assert ids_of(page) == history[:3]
+    assert page["has_more_before"] is False
+    assert page["has_more_after"] is True
+
+def test_around_centres_window_on_message(history):
+    target = history[4]
+    page = fetch(limit=4, around=target)
+    assert ids_of(page) == history[2:6]
+    assert page["has_more_before"] is True
+    assert page["has_more_after"] is True
+
+    edge = fetch(limit=4, around=history[0])
+    assert ids_of(edge) == history[0:4]
+    assert edge["has_more_before"] is False
+
+def test_projects_first_status_without_search_text(history):
+    message = fetch(limit=1)["messages"][0]
+    assert message["status"] == [{"status": "sent"}]
+    assert "search_text" not in message
@@ -0,0 +1,19 @@
+"""Kiểm tra các bước chuyển đổi dữ liệu chạy ở background."""
+import asyncio
+
+from app.migrations import drop_superseded_indexes
+
+def test_drops_superseded_message_index(db):
+    async def scenario():
+        await db.messages.create_index([("conversation_id", 1), ("created_at", -1)])
+        await db.messages.create_index([("conversation_id", 1), ("created_at", -1), ("_id", -1)])
+
+        await drop_superseded_indexes(db)
+        indexes = await db.messages.index_information()
+        assert "conversation_id_1_created_at_-1" not in indexes
+        assert "conversation_id_1_created_at_-1__id_-1" in indexes
+
+        # Lần khởi động sau không còn index cũ để xóa
+        await drop_superseded_indexes(db)
+
+    asyncio.run(scenario())
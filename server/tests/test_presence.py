@@ -0,0 +1,87 @@
+"""Kiểm tra PresenceService: ghi online/offline theo số kết nối đếm ở broker."""
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app.services import presence as presence_module
+from app.services.presence import PresenceService
+from app.websocket import manager
+from app.websocket.broker import MemoryBroker
+
+@pytest.fixture
+def service(db, monkeypatch):
+    async def no_friends(db, user_id):
+        return set()
+
+    async def noop(user_ids):
+        pass
+
+    monkeypatch.setattr(presence_module, "get_database", lambda: db)
+    monkeypatch.setattr(presence_module, "get_friend_ids", no_friends)
+    monkeypatch.setattr(presence_module, "invalidate_users", noop)
+    monkeypatch.setattr(presence_module.settings, "PRESENCE_FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(presence_module.settings, "PRESENCE_OFFLINE_GRACE", 10.0)
+    monkeypatch.setattr(manager, "broker", MemoryBroker())
+    return PresenceService()
+
+async def connect(service: PresenceService, user_id: str):
+    service.user_connected(user_id, await manager.broker.add_presence(user_id))
+
+async def disconnect(service: PresenceService, user_id: str):
+    await service.user_disconnected(user_id, await manager.broker.remove_presence(user_id))
+
+async def insert_user(db) -> str:
+    result = await db.users.insert_one({"username": "u", "status": "offline", "last_online": None})
+    return str(result.inserted_id)
+
+async def status_of(db, user_id: str) -> str:
+    return (await db.users.find_one({"_id": ObjectId(user_id)}))["status"]
+
+def test_stop_writes_offline_for_users_in_grace_period(service, db):
+    async def scenario():
+        user_id = await insert_user(db)
+        service.start()
+        await connect(service, user_id)
+        await asyncio.sleep(0.05)
+        assert await status_of(db, user_id) == "online"
+
+        # Server tắt: kết nối đóng trước, sau đó mới dừng service khi timer offline còn chờ
+        await disconnect(service, user_id)
+        await service.stop()
+        assert await status_of(db, user_id) == "offline"
+
+    asyncio.run(scenario())
+
+def test_stop_keeps_users_connected_elsewhere_online(service, db):
+    async def scenario():
+        user_id = await insert_user(db)
+        service.start()
+        await connect(service, user_id)
+        await asyncio.sleep(0.05)
+
+        await disconnect(service, user_id)
+        # Kết nối lại ở worker khác trong khoảng chờ
+        await manager.broker.add_presence(user_id)
+        await service.stop()
+        assert await status_of(db, user_id) == "online"
+
+    asyncio.run(scenario())
+
+def test_reconnect_within_grace_period_writes_nothing(service, db):
+    async def scenario():
+        user_id = await insert_user(db)
+        service.start()
+        await connect(service, user_id)
+        await asyncio.sleep(0.05)
+        online_at = (await db.users.find_one({"_id": ObjectId(user_id)}))["last_online"]
+
+        await disconnect(service, user_id)
+        await connect(service, user_id)
+        await asyncio.sleep(0.05)
+        assert service.pending == 0
+        assert (await db.users.find_one({"_id": ObjectId(user_id)}))["last_online"] == online_at
+        await service.stop()
+        assert await status_of(db, user_id) == "online"
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+"""Kiểm tra tạo ảnh thu nhỏ trong process pool."""
+import asyncio
+import os
+
+import pytest
+
+from app.services import thumbnails
+from app.services.blob_store import BLOB_DIR, derivative_name
+
+Image = pytest.importorskip("PIL.Image")
+
+BLOB_ID = "b" * 64 + ".png"
+
+@pytest.fixture
+def image_blob(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(BLOB_DIR)
+    Image.new("RGB", (600, 300), "red").save(os.path.join(BLOB_DIR, BLOB_ID))
+    yield
+    thumbnails.shutdown()
+
+def test_pool_does_not_fork(image_blob):
+    # Fork một process đã có nhiều thread có thể làm process con kẹt ở khóa được kế thừa
+    assert thumbnails._get_executor()._mp_context.get_start_method() == "spawn"
+
+def test_generates_derivatives_and_records_image(image_blob, db):
+    async def scenario():
+        await db.blobs.insert_one({"_id": BLOB_ID, "refcount": 0})
+        thumbnails.schedule_derivatives(db, BLOB_ID, ".png")
+        image = await thumbnails.wait_for_image(db, BLOB_ID)
+
+        assert image["width"] == 600 and image["height"] == 300
+        assert os.path.exists(os.path.join(BLOB_DIR, derivative_name(BLOB_ID, 240)))
+        assert os.path.exists(os.path.join(BLOB_DIR, derivative_name(BLOB_ID, 480)))
+        stored = await db.blobs.find_one({"_id": BLOB_ID})
+        assert stored["image"]["thumbnails"] == image["thumbnails"]
+
+    asyncio.run(scenario())
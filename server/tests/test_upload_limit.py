@@ -0,0 +1,71 @@
+"""Kiểm tra UploadLimitMiddleware: file quá lớn bị từ chối trước khi route đọc form."""
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.services.storage import MULTIPART_OVERHEAD, UploadLimitMiddleware
+
+MAX_SIZE = 1024 * 1024
+
+@pytest.fixture
+def upload_app():
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        app.state.calls += 1
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, limits={"/upload": MAX_SIZE})
+    return app
+
+def multipart_chunks(size: int, chunk_size: int = 64 * 1024):
+    yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n'
+    for start in range(0, size, chunk_size):
+        yield b"x" * min(chunk_size, size - start)
+    yield b"\r\n--b--\r\n"
+
+def test_accepts_file_within_limit(upload_app):
+    client = TestClient(upload_app)
+    response = client.post("/upload", files={"file": ("a.bin", b"x" * MAX_SIZE)})
+    assert response.status_code == 200
+    assert response.json() == {"size": MAX_SIZE}
+
+def test_rejects_declared_size_before_reading_body(upload_app):
+    received = []
+
+    async def app(scope, receive, send):
+        async def tracking_receive():
+            message = await receive()
+            received.append(message)
+            return message
+        await upload_app(scope, tracking_receive, send)
+
+    client = TestClient(app)
+    response = client.post("/upload", files={"file": ("a.bin", b"x" * (MAX_SIZE + MULTIPART_OVERHEAD))})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "File quá lớn (tối đa 1MB)"}
+    assert received == []
+    assert upload_app.state.calls == 0
+
+def test_rejects_undeclared_size_while_streaming(upload_app):
+    client = TestClient(upload_app)
+    # Không có Content-Length (chunked): chỉ biết kích thước khi đếm byte nhận được
+    response = client.post(
+        "/upload",
+        content=multipart_chunks(MAX_SIZE + MULTIPART_OVERHEAD),
+        headers={"content-type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "File quá lớn (tối đa 1MB)"}
+    assert upload_app.state.calls == 0
+
+def test_other_paths_are_not_limited(upload_app):
+    @upload_app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    client = TestClient(upload_app)
+    response = client.post("/other", files={"file": ("a.bin", b"x" * (MAX_SIZE * 2))})
+    assert response.json() == {"size": MAX_SIZE * 2}